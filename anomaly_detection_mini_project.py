@@ -27,7 +27,6 @@ It's time to do some basic exploratory analysis on the retail store transactiona
 
 """
 
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -35,7 +34,21 @@ import matplotlib
 import warnings
 warnings.filterwarnings('ignore')
 
-df = pd.read_excel(r"C:\Users\chukw\PycharmProjects\Anomaly-dectection-mini-project\Sample - Superstore.xls")
+from superstore_cache import load_superstore
+from model_registry import get_or_fit
+from score_cache import cached_decision_function, default_cache, higher_is_anomalous
+from iforest_boundary import plot_outlier_region, outlier_intervals
+from topk import top_k, top_k_rows
+from temporal import detect_temporal_anomalies
+from compact import FeatureMatrix
+from fast_plots import daily_rollup, rollup_lineplot, histplot
+# per-stage timings and memory when ANOMALY_TRACE=<path> is set, see instrumentation
+from instrumentation import stage
+
+# The workbook is parsed once and cached as Parquet next to it, later runs read the cache
+with stage('load') as load_stage:
+    df = load_superstore()
+    load_stage.add_rows(len(df))
 df.info()
 
 # We don't have any major missing values in our dataset and we can now look at a sample subset of the data
@@ -45,21 +58,32 @@ print(df.head())
 # Let's look more closely at the Sales attribute of the dataset in the next few cells.
 # We'll start by looking at typical sales over time
 
-fig, ax = plt.subplots(1, 1, figsize=(12, 6))
-sns.lineplot(x=df['Order Date'], y=df['Sales'])
-plt.show()
+with stage('plot', rows=len(df), figure='Sales over time'):
+    fig, ax = plt.subplots(1, 1, figsize=(12, 6))
+    # drawn from one daily rollup (mean and 95% interval per day), downsampled to the width of the axes
+    rollup_lineplot(daily_rollup(df, 'Sales'), ax=ax)
+    plt.show()
+
+# Flag days whose total sales are unusual compared with the 30 preceding days that had sales (days without
+# transactions are skipped, so the window can span more than 30 calendar days)
+with stage('score', rows=len(df), method='temporal', column='Sales'):
+    sales_daily_anomalies = detect_temporal_anomalies(df, 'Sales', freq='D', window=30)
+print('Anomalous Sales Days:', sales_daily_anomalies['Outlier'].sum())
 
 # Visualize Sales Distribution
 # Let's now look at the data distribution for Sales
 
-sns.distplot(df['Sales'])
-plt.title("Sales Distribution");
-plt.show()
+# binned histogram and KDE, computed once per column and reused by the outlier-region plots below
+with stage('plot', rows=len(df), figure='Sales distribution'):
+    histplot(df['Sales'])
+    plt.title("Sales Distribution");
+    plt.show()
 
 df['Sales'].describe()
 
-sns.distplot(df['Sales'])
-plt.title("Sales Distribution");
+with stage('plot', rows=len(df), figure='Sales distribution'):
+    histplot(df['Sales'])
+    plt.title("Sales Distribution");
 print(df['Sales'].describe())
 
 # We can definitely see the presence of potential outliers in terms of the min or max values as compared to the meat of the distribution in the interquartile range as observed in the distribution statistics
@@ -69,16 +93,23 @@ print(df['Sales'].describe())
 
 # Your turn: Plot Order Date vs. Profit using a line plot
 
-fig, ax = plt.subplots(1, 1, figsize=(12, 6))
-sns.lineplot(x=df['Order Date'], y=df['Profit'])
-plt.show()
+with stage('plot', rows=len(df), figure='Profit over time'):
+    fig, ax = plt.subplots(1, 1, figsize=(12, 6))
+    # drawn from one daily rollup (mean and 95% interval per day), downsampled to the width of the axes
+    rollup_lineplot(daily_rollup(df, 'Profit'), ax=ax)
+    plt.show()
+
+with stage('score', rows=len(df), method='temporal', column='Profit'):
+    profit_daily_anomalies = detect_temporal_anomalies(df, 'Profit', freq='D', window=30)
+print('Anomalous Profit Days:', profit_daily_anomalies['Outlier'].sum())
 
 # Q 2.2: Visualize Profit Distribution
 # Let's now look at the data distribution for Profit
 # Your turn: Plot the distribution for Profit
-sns.distplot(df['Profit'])
-plt.title("Profit Distribution")
-plt.show()
+with stage('plot', rows=len(df), figure='Profit distribution'):
+    histplot(df['Profit'])
+    plt.title("Profit Distribution")
+    plt.show()
 
 # Your turn: Get the essential descriptive statistics for Profit using an appropriate function
 print(df["Profit"].describe())
@@ -89,8 +120,9 @@ print(df["Profit"].describe())
 
 # Visualize Discount vs. Profit
 
-sns.scatterplot(x="Discount", y="Profit", data=df)
-plt.show()
+with stage('plot', rows=len(df), figure='Discount vs. Profit'):
+    sns.scatterplot(x="Discount", y="Profit", data=df)
+    plt.show()
 
 # In the above visual, we look at a scatter plot showing the distribution of profits w.r.t discounts given
 
@@ -113,55 +145,62 @@ Here we start off by implementing anomaly detecting using statistical modeling o
 # + 3 rule where is the mean of the distribution and
 # is the standard deviation of the distribution.
 
-mean_sales = df['Sales'].mean()
-sigma_sales = df['Sales'].std()
-three_sigma_sales = 3*sigma_sales
+with stage('fit', rows=len(df), method='sigma', column='Sales'):
+    mean_sales = df['Sales'].mean()
+    sigma_sales = df['Sales'].std()
+    three_sigma_sales = 3*sigma_sales
 
-threshold_sales_value = mean_sales + three_sigma_sales
+with stage('threshold', rows=len(df), method='sigma', column='Sales'):
+    threshold_sales_value = mean_sales + three_sigma_sales
 print('Threshold Sales:', threshold_sales_value)
 
 # Visualize Outlier Region
-fig, ax = plt.subplots(1, 1, figsize=(12, 6))
+with stage('plot', rows=len(df), figure='Sales outlier region'):
+    fig, ax = plt.subplots(1, 1, figsize=(12, 6))
 
-sns.distplot(df['Sales'])
-plt.axvspan(threshold_sales_value, df['Sales'].max(), facecolor='r', alpha=0.3)
-plt.title("Sales Distribution with Outlier Region");
+    histplot(df['Sales'])
+    plt.axvspan(threshold_sales_value, df['Sales'].max(), facecolor='r', alpha=0.3)
+    plt.title("Sales Distribution with Outlier Region");
 
 
 # Filter and Sort Outliers
 # Here we filter out the outlier observations and sort by descending order and view the top 5 outlier values
 
-sales_outliers_df = df['Sales'][df['Sales'] > threshold_sales_value]
+with stage('threshold', rows=len(df), method='sigma', column='Sales'):
+    sales_outliers_df = df['Sales'][df['Sales'] > threshold_sales_value]
 print('Total Sales Outliers:', len(sales_outliers_df))
-sales_outliers_sorted = sales_outliers_df.sort_values(ascending=False)
-sales_outliers_sorted.head(5)
+with stage('report', rows=len(df)):
+    sales_outliers_sorted = top_k(sales_outliers_df, 5)
+sales_outliers_sorted
 
 
-sales_outliers_df = df['Sales'][df['Sales'] > threshold_sales_value]
+with stage('threshold', rows=len(df), method='sigma', column='Sales'):
+    sales_outliers_df = df['Sales'][df['Sales'] > threshold_sales_value]
 print('Total Sales Outliers:', len(sales_outliers_df))
-sales_outliers_sorted = sales_outliers_df.sort_values(ascending=False)
-sales_outliers_sorted.head(5)
+with stage('report', rows=len(df)):
+    sales_outliers_sorted = top_k(sales_outliers_df, 5)
+sales_outliers_sorted
 
 # View Top 10 Outlier Transactions
 
-(df.loc[sales_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).head(10)
+top_k_rows(df, 'Sales', 10, rows=sales_outliers_df.index)
 # View Bottom 10 Outlier Transactions
 
-(df.loc[sales_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).tail(10)
+top_k_rows(df, 'Sales', 10, rows=sales_outliers_df.index, largest=False)
 
 
-mean_profit = df["Profit"].mean()
-sigma_profit = df["Profit"].std()
-three_sigma_profit = 3*sigma_profit
+with stage('fit', rows=len(df), method='sigma', column='Profit'):
+    mean_profit = df["Profit"].mean()
+    sigma_profit = df["Profit"].std()
+    three_sigma_profit = 3*sigma_profit
 
-threshold_profit_upper_limit = mean_sales + three_sigma_sales
-threshold_profit_upper_limit = threshold_profit_upper_limit.max()
-threshold_profit_lower_limit = mean_sales + three_sigma_sales
-threshold_profit_lower_limit = threshold_profit_lower_limit.min()
+with stage('threshold', rows=len(df), method='sigma', column='Profit'):
+    threshold_profit_upper_limit = mean_sales + three_sigma_sales
+    threshold_profit_upper_limit = threshold_profit_upper_limit.max()
+    threshold_profit_lower_limit = mean_sales + three_sigma_sales
+    threshold_profit_lower_limit = threshold_profit_lower_limit.min()
 
-threshold_profit_value = mean_profit + three_sigma_sales
+    threshold_profit_value = mean_profit + three_sigma_sales
 print('Threshold Sales:', threshold_profit_value)
 
 
@@ -169,31 +208,33 @@ print('Thresholds Profit:', threshold_profit_lower_limit, threshold_profit_upper
 
 # Visualize Outlier Regions
 # Your turn: Visualize the upper and lower outlier regions in the distribution similar to what you did in 3.1
-fig, ax = plt.subplots(1, 1, figsize=(12, 6))
-sns.distplot(df['Profit'])
-plt.axvspan( threshold_profit_lower_limit, df['Profit'].max(), facecolor='r', alpha=0.3)
-plt.title("Upper Profit Distribution with Outlier Region")
+with stage('plot', rows=len(df), figure='Profit outlier regions'):
+    fig, ax = plt.subplots(1, 1, figsize=(12, 6))
+    histplot(df['Profit'])
+    plt.axvspan( threshold_profit_lower_limit, df['Profit'].max(), facecolor='r', alpha=0.3)
+    plt.title("Upper Profit Distribution with Outlier Region")
 
-fig, ax = plt.subplots(1, 1, figsize=(12, 6))
-sns.distplot(df['Profit'])
-plt.axvspan( threshold_profit_lower_limit, df['Profit'].min(), facecolor='r', alpha=0.3)
-plt.title("Lower Profit Distribution with Outlier Region")
+    fig, ax = plt.subplots(1, 1, figsize=(12, 6))
+    histplot(df['Profit'])
+    plt.axvspan( threshold_profit_lower_limit, df['Profit'].min(), facecolor='r', alpha=0.3)
+    plt.title("Lower Profit Distribution with Outlier Region")
 
 
 # Filter and Sort Outliers
 #
 # Here we filter out the outlier observations and sort by descending order and view the top 5 outlier values
 
-profit_outliers_df = df['Profit'][df['Profit'] > threshold_profit_value]
+with stage('threshold', rows=len(df), method='sigma', column='Profit'):
+    profit_outliers_df = df['Profit'][df['Profit'] > threshold_profit_value]
 print('Total Sales Outliers:', len(profit_outliers_df))
-profit_outliers_sorted = profit_outliers_df.sort_values(ascending=False)
-print(profit_outliers_sorted.head(5))
+with stage('report', rows=len(df)):
+    profit_outliers_sorted = top_k(profit_outliers_df, 5)
+print(profit_outliers_sorted)
 
 
 # View Top 10 Outlier Transactions
 # Your turn: View the top ten transactions based on highest profits
-print((df.loc[profit_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).head(10))
+print(top_k_rows(df, 'Profit', 10, rows=profit_outliers_df.index))
 
 
 # Q: Do you notice any interesting insights based on these transactions?
@@ -203,8 +244,7 @@ print((df.loc[profit_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-C
 
 # Your turn: View the bottom ten transactions based on lowest profits (highest losses)
 
-print((df.loc[profit_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).tail(10))
+print(top_k_rows(df, 'Profit', 10, rows=profit_outliers_df.index, largest=False))
 """
 Q: Do you notice any interesting insights based on these transactions?
 
@@ -221,52 +261,46 @@ More details are available in this User Guide"""
 
 # Initialize and Train Model
 # Here we initialize the isolation forest model with some hyperparameters assuming the proportion of outliers to be 1% of the total data (using the contamination setting)
+# Fitted models are kept in a registry on disk, so re-running with the same data and settings skips training
 
 from sklearn.ensemble import IsolationForest
 
-sales_ifmodel = IsolationForest(n_estimators=100,
-                                contamination=0.01)
-sales_ifmodel.fit(df[['Sales']])
+with stage('fit', rows=len(df), method='iforest', column='Sales'):
+    sales_ifmodel = IsolationForest(n_estimators=100,
+                                    contamination=0.01)
+    sales_ifmodel = get_or_fit(sales_ifmodel, df[['Sales']])
 
 
 # Visualize Outlier Region
 #
 # Here we visualize the outlier region in the data distribution
 
-xx = np.linspace(df['Sales'].min(), df['Sales'].max(), len(df)).reshape(-1,1)
-anomaly_score = sales_ifmodel.decision_function(xx)
-outlier = sales_ifmodel.predict(xx)
-plt.figure(figsize=(12, 6))
-plt.plot(xx, anomaly_score, label='anomaly score')
-plt.fill_between(xx.T[0], np.min(anomaly_score), np.max(anomaly_score),
-                 where=outlier==-1, color='r',
-                 alpha=.4, label='outlier region')
-plt.legend()
-plt.ylabel('anomaly score')
-plt.xlabel('Sales');
+# The score of a univariate Isolation Forest is a step function between the split points of its trees,
+# so the outlier region is read exactly from the fitted trees instead of scoring a dense grid
+with stage('plot', figure='Sales outlier region'):
+    plot_outlier_region(sales_ifmodel, df['Sales'].min(), df['Sales'].max(), 'Sales')
+print('Sales Outlier Intervals:', outlier_intervals(sales_ifmodel))
 
 # Filter and Sort Outliers
 # Here we predict outliers in our dataset using our trained model and filter out the outlier observations and sort by descending order and view the top 5 outlier values
 
-outlier_predictions = sales_ifmodel.predict(df[['Sales']])
+with stage('score', rows=len(df), method='iforest', column='Sales'):
+    outlier_mask = default_cache.outlier_mask(sales_ifmodel, df[['Sales']])
 
-sales_outliers_df = df[['Sales']]
-sales_outliers_df['Outlier'] = outlier_predictions
-sales_outliers_df = sales_outliers_df[sales_outliers_df['Outlier'] == -1]['Sales']
+sales_outliers_df = df['Sales'][outlier_mask]
 
 print('Total Sales Outliers:', len(sales_outliers_df))
-sales_outliers_sorted = sales_outliers_df.sort_values(ascending=False)
-sales_outliers_sorted.head(5)
+with stage('report', rows=len(df)):
+    sales_outliers_sorted = top_k(sales_outliers_df, 5)
+sales_outliers_sorted
 
 
 
-(df.loc[sales_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).head(10)
+top_k_rows(df, 'Sales', 10, rows=sales_outliers_df.index)
 
 # View Bottom 10 Outlier Transactions
 
-(df.loc[sales_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).tail(10)
+top_k_rows(df, 'Sales', 10, rows=sales_outliers_df.index, largest=False)
 
 """
 Q 3.4: Univariate Anomaly Detection on Profit using Isolation Forest
@@ -280,44 +314,37 @@ Your Turn: Initialize the isolation forest model with similar hyperparameters as
 
 from sklearn.ensemble import IsolationForest
 
-sales_ifmodel = IsolationForest(n_estimators=100,
-                                contamination=0.01)
-sales_ifmodel.fit(df[['Sales']])
+with stage('fit', rows=len(df), method='iforest', column='Sales'):
+    sales_ifmodel = IsolationForest(n_estimators=100,
+                                    contamination=0.01)
+    sales_ifmodel = get_or_fit(sales_ifmodel, df[['Sales']])
 
 
 # Visualize Outlier Region
 # Here we visualize the outlier region in the data distribution
 
-xx = np.linspace(df['Sales'].min(), df['Sales'].max(), len(df)).reshape(-1,1)
-anomaly_score = sales_ifmodel.decision_function(xx)
-outlier = sales_ifmodel.predict(xx)
-plt.figure(figsize=(12, 6))
-plt.plot(xx, anomaly_score, label='anomaly score')
-plt.fill_between(xx.T[0], np.min(anomaly_score), np.max(anomaly_score),
-                 where=outlier==-1, color='r',
-                 alpha=.4, label='outlier region')
-plt.legend()
-plt.ylabel('anomaly score')
-plt.xlabel('Sales');
+# The score of a univariate Isolation Forest is a step function between the split points of its trees,
+# so the outlier region is read exactly from the fitted trees instead of scoring a dense grid
+with stage('plot', figure='Sales outlier region'):
+    plot_outlier_region(sales_ifmodel, df['Sales'].min(), df['Sales'].max(), 'Sales')
+print('Sales Outlier Intervals:', outlier_intervals(sales_ifmodel))
 
 # Filter and Sort Outliers
 # Here we predict outliers in our dataset using our trained model and filter out the outlier observations and sort by descending order and view the top 5 outlier values
-outlier_predictions = sales_ifmodel.predict(df[['Sales']])
+with stage('score', rows=len(df), method='iforest', column='Sales'):
+    outlier_mask = default_cache.outlier_mask(sales_ifmodel, df[['Sales']])
 
-sales_outliers_df = df[['Sales']]
-sales_outliers_df['Outlier'] = outlier_predictions
-sales_outliers_df = sales_outliers_df[sales_outliers_df['Outlier'] == -1]['Sales']
+sales_outliers_df = df['Sales'][outlier_mask]
 
 print('Total Sales Outliers:', len(sales_outliers_df))
-sales_outliers_sorted = sales_outliers_df.sort_values(ascending=False)
-sales_outliers_sorted.head(5)
+with stage('report', rows=len(df)):
+    sales_outliers_sorted = top_k(sales_outliers_df, 5)
+sales_outliers_sorted
 
 # View Top 10 Outlier Transactions
-(df.loc[sales_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).head(10)
+top_k_rows(df, 'Sales', 10, rows=sales_outliers_df.index)
 # View Bottom 10 Outlier Transactions
-(df.loc[sales_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).tail(10)
+top_k_rows(df, 'Sales', 10, rows=sales_outliers_df.index, largest=False)
 
 """
 Q 3.4: Univariate Anomaly Detection on Profit using Isolation Forest
@@ -328,47 +355,40 @@ Initialize and Train Model
 Your Turn: Initialize the isolation forest model with similar hyperparameters as Section 3.3 and also assuming the proportion of outliers to be 1% of the total data (using the contamination setting)
 """
 
-sales_ifmodel = IsolationForest(n_estimators=100,
-                                contamination=0.01)
-sales_ifmodel.fit(df[['Profit']])
+with stage('fit', rows=len(df), method='iforest', column='Profit'):
+    sales_ifmodel = IsolationForest(n_estimators=100,
+                                    contamination=0.01)
+    sales_ifmodel = get_or_fit(sales_ifmodel, df[['Profit']])
 # Here we visualize the outlier region in the data distribution
 
-xx = np.linspace(df['Profit'].min(), df['Profit'].max(), len(df)).reshape(-1,1)
-anomaly_score = sales_ifmodel.decision_function(xx)
-outlier = sales_ifmodel.predict(xx)
-plt.figure(figsize=(12, 6))
-plt.plot(xx, anomaly_score, label='anomaly score')
-plt.fill_between(xx.T[0], np.min(anomaly_score), np.max(anomaly_score),
-                 where=outlier==-1, color='r',
-                 alpha=.4, label='outlier region')
-plt.legend()
-plt.ylabel('anomaly score')
-plt.xlabel('Profit')
+# The score of a univariate Isolation Forest is a step function between the split points of its trees,
+# so the outlier region is read exactly from the fitted trees instead of scoring a dense grid
+with stage('plot', figure='Profit outlier region'):
+    plot_outlier_region(sales_ifmodel, df['Profit'].min(), df['Profit'].max(), 'Profit')
+print('Profit Outlier Intervals:', outlier_intervals(sales_ifmodel))
 plt.show()
 
 # Filter and Sort Outliers
 
 # Your Turn: Predict outliers in our dataset using our trained model and filter out the outlier observations and sort by descending order and view the top 5 outlier values similar to 3.3
-outlier_predictions = sales_ifmodel.predict(df[['Sales']])
+with stage('score', rows=len(df), method='iforest', column='Profit'):
+    outlier_mask = default_cache.outlier_mask(sales_ifmodel, df[['Profit']])
 
-profit_outliers_df = df[['Profit']]
-profit_outliers_df['Outlier'] = outlier_predictions
-profit_outliers_df = sales_outliers_df[sales_outliers_df['Outlier'] == -1]['Profit']
+profit_outliers_df = df['Profit'][outlier_mask]
 
 print('Total Profit Outliers:', len(profit_outliers_df))
-profit_outliers_sorted = sales_outliers_df.sort_values(ascending=False)
-profit_outliers_sorted.head(5)
+with stage('report', rows=len(df)):
+    profit_outliers_sorted = top_k(profit_outliers_df, 5)
+profit_outliers_sorted
 
 
 # View Top 10 Outlier Transactions
 #
 # Your turn: View the top ten transactions based on highest profits
-(df.loc[profit_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).head(10)
+top_k_rows(df, 'Profit', 10, rows=profit_outliers_df.index)
 # View Bottom 10 Outlier Transactions
 # Your turn: View the bottom ten transactions based on lowest profits (highest losses)
-(df.loc[profit_outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).tail(10)
+top_k_rows(df, 'Profit', 10, rows=profit_outliers_df.index, largest=False)
 
 # Q: Do you observe any similarity in the results with the previous method?
 # A: Yes
@@ -385,14 +405,13 @@ Multivariate is basically analysis done on more than one attribute or feature at
 You will learn how to train these models to detect outliers and also visualize these outliers. For this section we will be using the pyod package so make sure you have it installed.
 """
 # Extract Subset Data for Outlier Detection
-cols = ['Discount', 'Profit']
-subset_df = df[cols]
-subset_df.head()
-
 # Feature Scaling
-from sklearn.preprocessing import MinMaxScaler
-mms = MinMaxScaler(feature_range=(0, 1))
-subset_df[cols] = mms.fit_transform(subset_df)
+# The features are copied once into a contiguous float32 array and min-max scaled in place, subset_df is a view on
+# that array shared by all the detectors below, and each detector's outliers are kept as a boolean mask
+cols = ['Discount', 'Profit']
+with stage('scale', rows=len(df), columns=cols):
+    features = FeatureMatrix(df, cols, feature_range=(0, 1))
+    subset_df = features.frame()
 subset_df.head()
 
 """
@@ -408,26 +427,24 @@ Here we initialize the CBLOF model with some hyperparameters assuming the propor
 from pyod.models import cblof
 
 cblof_model = cblof.CBLOF(contamination=0.01, random_state=42)
-cblof_model.fit(subset_df)
+with stage('fit', rows=len(subset_df), method='cblof'):
+    cblof_model = get_or_fit(cblof_model, subset_df)
 
 
 # Filter and Sort Outliers
 # Here we predict outliers in our dataset using our trained model and filter out the outlier observations and sort by descending order and view the top 5 outlier values
 
-outlier_predictions = cblof_model.predict(subset_df)
+with stage('score', rows=len(subset_df), method='cblof'):
+    outlier_mask = features.set_flags('CBLOF', default_cache.outlier_mask(cblof_model, subset_df))
 
-outliers_df = subset_df.copy(deep=True)
-outliers_df['Outlier'] = outlier_predictions
-outliers_df = outliers_df[outliers_df['Outlier'] == 1]
-
-print('Total Outliers:', len(outliers_df))
-outliers_sorted = outliers_df.sort_values(by=['Profit', 'Discount'], ascending=False)
-outliers_sorted.head(5)
+print('Total Outliers:', outlier_mask.sum())
+with stage('report', rows=len(subset_df)):
+    outliers_sorted = top_k_rows(subset_df, ['Profit', 'Discount'], 5, columns=cols, rows=outlier_mask)
+outliers_sorted
 
 # View Bottom 10 Outlier Transactions
 
-(df.loc[outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).tail(10)
+top_k_rows(df, ['Profit', 'Discount'], 10, rows=outlier_mask, largest=False)
 
 """
 We can definitely see some huge losses incurred based on giving higher discounts even if the sales amount was high which is interesting as well as concerning.
@@ -443,25 +460,24 @@ from pyod.models import iforest
 
 if_model = IsolationForest(n_estimators=100,
                                 contamination=0.01)
+with stage('fit', rows=len(subset_df), method='iforest'):
+    if_model = get_or_fit(if_model, subset_df)
 
 """
 Filter and Sort Outliers
 Your Turn: Predict outliers in our dataset using our trained model and filter out the outlier observations and sort by descending order and view the top 5 outlier values similar to 4.1
 """
 
-outlier_predictions = if_model.predict(subset_df)
-
-outliers_df = subset_df.copy(deep=True)
-outliers_df['Outlier'] = outlier_predictions
-outliers_df = outliers_df[outliers_df['Outlier'] == 1]
+with stage('score', rows=len(subset_df), method='iforest'):
+    outlier_mask = features.set_flags('Isolation Forest', default_cache.outlier_mask(if_model, subset_df))
 
-print('Total Outliers:', len(outliers_df))
-outliers_sorted = outliers_df.sort_values(by=['Profit', 'Discount'], ascending=False)
-outliers_sorted.head(5)
+print('Total Outliers:', outlier_mask.sum())
+with stage('report', rows=len(subset_df)):
+    outliers_sorted = top_k_rows(subset_df, ['Profit', 'Discount'], 5, columns=cols, rows=outlier_mask)
+outliers_sorted
 
 # View Bottom 10 Outlier Transactions
-(df.loc[outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).tail(10)
+top_k_rows(df, ['Profit', 'Discount'], 10, rows=outlier_mask, largest=False)
 
 # Q: Do you notice any differences in the results with the previous model?
 #
@@ -494,24 +510,36 @@ ae_model = auto_encoder.AutoEncoder(hidden_neurons=[2, 32, 32, 2],
 
 # Train Model
 # Your turn: Train the model by calling the fit() function on the right data
-ae_model.fit(subset_df)
+with stage('fit', rows=len(subset_df), method='ae'):
+    ae_model = get_or_fit(ae_model, subset_df)
 
 # Filter and Sort Outliers
 # Your Turn: Predict outliers in our dataset using our trained model and filter out the outlier observations and sort by descending order and view the top 5 outlier values similar to 4.1
-outlier_predictions = ae_model.predict(subset_df)
-
-outliers_df = subset_df.copy(deep=True)
-outliers_df['Outlier'] = outlier_predictions
-outliers_df = outliers_df[outliers_df['Outlier'] == 1]
+with stage('score', rows=len(subset_df), method='ae'):
+    outlier_mask = features.set_flags('Auto-Encoder', default_cache.outlier_mask(ae_model, subset_df))
 
-print('Total Outliers:', len(outliers_df))
-outliers_sorted = outliers_df.sort_values(by=['Profit', 'Discount'], ascending=False)
-outliers_sorted.head(5)
+print('Total Outliers:', outlier_mask.sum())
+with stage('report', rows=len(subset_df)):
+    outliers_sorted = top_k_rows(subset_df, ['Profit', 'Discount'], 5, columns=cols, rows=outlier_mask)
+outliers_sorted
 
 # View Bottom 10 Outlier Transactions
 # Your turn: View the bottom ten transactions
-(df.loc[outliers_sorted.index.tolist()][['City', 'Category', 'Sub-Category', 'Product Name',
-                                              'Sales', 'Quantity', 'Discount', 'Profit']]).tail(10)
+top_k_rows(df, ['Profit', 'Discount'], 10, rows=outlier_mask, largest=False)
+
+
+# A linear auto-encoder trained with squared error learns the principal components of its input, so for two features
+# the reconstruction error can also be computed in closed form - the fit takes milliseconds instead of 100 epochs
+
+from reconstruction import ReconstructionDetector
+
+recon_model = ReconstructionDetector(n_components=1, contamination=0.01)
+with stage('fit', rows=len(subset_df), method='recon'):
+    recon_model = get_or_fit(recon_model, subset_df)
+with stage('score', rows=len(subset_df), method='recon'):
+    outlier_mask = features.set_flags('Reconstruction', default_cache.outlier_mask(recon_model, subset_df))
+print('Total Outliers:', outlier_mask.sum())
+top_k_rows(df, ['Profit', 'Discount'], 10, rows=outlier_mask, largest=False)
 
 
 # 4.4: Visualize Anomalies and Compare Anomaly Detection Models
@@ -519,27 +547,30 @@ outliers_sorted.head(5)
 # Here we will look at the visual plots of anomalies as detected by the above three models
 
 def visualize_anomalies(model, xx, yy, data_df, ax_obj, subplot_title):
-    # predict raw anomaly score
-    scores_pred = model.decision_function(data_df) * -1
-    # prediction of a datapoint category outlier or inlier
-    y_pred = model.predict(data_df)
-    n_inliers = len(y_pred) - np.count_nonzero(y_pred)
-    n_outliers = np.count_nonzero(y_pred == 1)
-
-    out_df = data_df.copy(deep=True)
-    out_df['Outlier'] = y_pred.tolist()
+    # raw scores oriented so that lower is more anomalous: pyod detectors score outliers high and are flipped,
+    # sklearn's IsolationForest already scores them low (computed once per model and dataset, see score_cache)
+    sign = -1 if higher_is_anomalous(model) else 1
+    scores_pred = cached_decision_function(model, data_df) * sign
+    # prediction of a datapoint category outlier or inlier, derived from the same cached scores
+    is_outlier = default_cache.outlier_mask(model, data_df)
+    n_outliers = np.count_nonzero(is_outlier)
+    n_inliers = len(is_outlier) - n_outliers
+
+    discount = data_df['Discount'].to_numpy()
+    profit = data_df['Profit'].to_numpy()
     # discount - inlier feature 1,  profit - inlier feature 2
-    inliers_discount = out_df[out_df['Outlier'] == 0]['Discount'].values
-    inliers_profit = out_df[out_df['Outlier'] == 0]['Profit'].values
+    inliers_discount = discount[~is_outlier]
+    inliers_profit = profit[~is_outlier]
     # discount - outlier feature 1, profit - outlier feature 2
-    outliers_discount = out_df[out_df['Outlier'] == 1]['Discount'].values
-    outliers_profit = out_df[out_df['Outlier'] == 1]['Profit'].values
+    outliers_discount = discount[is_outlier]
+    outliers_profit = profit[is_outlier]
 
     # Use threshold value to consider a datapoint inlier or outlier
     # threshold = stats.scoreatpercentile(scores_pred,100 * outliers_fraction)
     threshold = np.percentile(scores_pred, 100 * outliers_fraction)
     # decision function calculates the raw anomaly score for every point
-    Z = model.decision_function(np.c_[xx.ravel(), yy.ravel()]) * -1
+    # score the grid in the same dtype as the (float32) training features
+    Z = model.decision_function(np.c_[xx.ravel(), yy.ravel()].astype(data_df.to_numpy().dtype)) * sign
     Z = Z.reshape(xx.shape)
     # fill blue map colormap from minimum anomaly score to threshold value
     ax_obj.contourf(xx, yy, Z, levels=np.linspace(Z.min(), threshold, 7), cmap=plt.cm.Blues_r)
@@ -550,7 +581,7 @@ def visualize_anomalies(model, xx, yy, data_df, ax_obj, subplot_title):
     b = ax_obj.scatter(inliers_discount, inliers_profit, c='white', s=20, edgecolor='k')
     c = ax_obj.scatter(outliers_discount, outliers_profit, c='black', s=20, edgecolor='k')
 
-    ax_obj.legend([a.collections[0], b, c], ['learned decision function', 'inliers', 'outliers'],
+    ax_obj.legend([a.legend_elements()[0][0], b, c], ['learned decision function', 'inliers', 'outliers'],
                   prop=matplotlib.font_manager.FontProperties(size=10), loc='upper right')
 
     ax_obj.set_xlim((0, 1))
@@ -570,11 +601,42 @@ plot_titles = ['Cluster-based Local Outlier Factor (CBLOF)',
                'Isolation Forest',
                'Auto-Encoder']
 
-for ax_obj, model, plot_title in zip(ax_objs, models, plot_titles):
-    visualize_anomalies(model=model,
-                        xx=xx, yy=yy,
-                        data_df=subset_df,
-                        ax_obj=ax_obj,
-                        subplot_title=plot_title)
-plt.axis('tight')
+with stage('plot', rows=len(subset_df), figure='decision functions'):
+    for ax_obj, model, plot_title in zip(ax_objs, models, plot_titles):
+        visualize_anomalies(model=model,
+                            xx=xx, yy=yy,
+                            data_df=subset_df,
+                            ax_obj=ax_obj,
+                            subplot_title=plot_title)
+    plt.axis('tight')
+
 
+# 4.5: Combined Verdict from an Ensemble of the Three Models
+#
+# The ensemble runner puts the scores of the three detectors on a common scale and combines them into one anomaly
+# score. The models of sections 4.1 - 4.4 are already fitted, so they are not refit: their cached scores are reused
+# in this process and no worker processes are started. (Unfitted detectors would be fitted in parallel worker
+# processes; under the spawn start method - Windows, macOS - those workers re-import this module, so pass unfitted
+# detectors to run_ensemble only from code that is not executed at import time.)
+
+from ensemble import run_ensemble
+
+if __name__ == '__main__':
+    with stage('score', rows=len(subset_df), method='ensemble'):
+        ensemble_scores, ensemble_models = run_ensemble(dict(zip(plot_titles, models)), subset_df,
+                                                        combination='average', contamination=outliers_fraction)
+    print('Total Ensemble Outliers:', ensemble_scores['Outlier'].sum())
+    print(top_k_rows(ensemble_scores, 'Combined', 5, columns=list(ensemble_scores.columns)))
+
+# Keep each model's per-row scores and flags in the indexed result store, so drill-downs by order, customer,
+# product or category no longer need a rerun of the whole script
+
+from result_store import ResultStore
+
+if __name__ == '__main__':
+    with ResultStore() as store:
+        for plot_title, model in zip(plot_titles, models):
+            store.append_model_run(model, subset_df, df, plot_title)
+        # top losses in Machines last quarter, as flagged by the Isolation Forest
+        print(store.top(10, by='Profit', detector='Isolation Forest', sub_category='Machines',
+                        start='2017-10-01', end='2017-12-31'))
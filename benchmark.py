@@ -0,0 +1,192 @@
+"""
+Benchmark harness for the detectors.
+
+Generates Superstore-shaped synthetic transactions (Sales log-normal, Discount drawn from the sample's discount
+levels, Profit = Sales * a margin that depends on the discount, all fitted to Sample - Superstore.xls) with injected
+anomalies, then measures fit time, score time, throughput and peak RSS for every detector and size, together with
+precision / recall against the injected anomalies. Each (detector, size) run happens in a fresh process so that peak
+RSS is not polluted by earlier runs.
+
+    python benchmark.py --sizes 10000 100000 1000000 --detectors sigma iforest_1d cblof --out bench.json
+"""
+
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+FEATURES = ['Sales', 'Discount', 'Profit']
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+# slower detectors are capped so that a full run finishes in reasonable time
+DEFAULT_MAX_ROWS = {'sigma': None, 'iforest_1d': None, 'iforest': 10_000_000, 'cblof': 1_000_000,
+                    'cblof_minibatch': None, 'ae': 100_000, 'recon': None}
+
+
+def sample_profile(source=None):
+    """Distribution parameters of the Superstore sample used by synthetic_transactions()."""
+    from superstore_cache import DEFAULT_DATASET, load_superstore
+
+    df = load_superstore(source or DEFAULT_DATASET, columns=FEATURES)
+    margin = df['Profit'] / df['Sales']
+    by_discount = margin.groupby(df['Discount']).agg(['mean', 'std']).fillna(0.0)
+    counts = df['Discount'].value_counts().reindex(by_discount.index)
+    log_sales = np.log(df['Sales'])
+    return {'log_sales_mean': float(log_sales.mean()), 'log_sales_std': float(log_sales.std()),
+            'discounts': by_discount.index.to_numpy(), 'discount_p': (counts / counts.sum()).to_numpy(),
+            'margin_mean': by_discount['mean'].to_numpy(), 'margin_std': by_discount['std'].to_numpy()}
+
+
+def synthetic_transactions(n_rows, profile, anomaly_fraction=0.005, random_state=0):
+    """Return (df, is_anomaly) with `anomaly_fraction` of rows replaced by sales spikes or heavy-loss deals."""
+    rng = np.random.default_rng(random_state)
+    level = rng.choice(len(profile['discounts']), size=n_rows, p=profile['discount_p'])
+    sales = np.exp(rng.normal(profile['log_sales_mean'], profile['log_sales_std'], n_rows))
+    margin = rng.normal(profile['margin_mean'][level], profile['margin_std'][level])
+    discount = profile['discounts'][level].astype(np.float64)
+
+    is_anomaly = np.zeros(n_rows, dtype=bool)
+    injected = rng.choice(n_rows, size=int(n_rows * anomaly_fraction), replace=False)
+    is_anomaly[injected] = True
+    spikes, losses = injected[::2], injected[1::2]
+    # huge orders at a normal margin
+    sales[spikes] *= rng.uniform(20, 60, len(spikes))
+    # deep discounts on big orders that lose more than they sell
+    sales[losses] *= rng.uniform(5, 20, len(losses))
+    discount[losses] = 0.8
+    margin[losses] = -rng.uniform(1.5, 3.0, len(losses))
+
+    df = pd.DataFrame({'Sales': sales, 'Discount': discount, 'Profit': sales * margin})
+    return df, is_anomaly
+
+
+def _scaled(df):
+    from sklearn.preprocessing import MinMaxScaler
+    return MinMaxScaler().fit_transform(df[FEATURES])
+
+
+def _make_detector(name, contamination):
+    # returns (prepare(df) -> X, estimator); estimators follow the sklearn or pyod scoring convention
+    if name == 'iforest_1d':
+        from univariate_iforest import UnivariateIsolationForest
+        return (lambda df: df[['Sales']].to_numpy()), UnivariateIsolationForest(contamination=contamination,
+                                                                                random_state=0)
+    if name == 'iforest':
+        from sklearn.ensemble import IsolationForest
+        return _scaled, IsolationForest(n_estimators=100, contamination=contamination, random_state=0)
+    if name == 'cblof':
+        from pyod.models import cblof
+        return _scaled, cblof.CBLOF(contamination=contamination, random_state=42)
+    if name == 'cblof_minibatch':
+        from minibatch_cblof import MiniBatchCBLOF
+        return _scaled, MiniBatchCBLOF(contamination=contamination, random_state=42)
+    if name == 'ae':
+        from pyod.models import auto_encoder
+        # pyod >= 2 (PyTorch) constructor arguments
+        return _scaled, auto_encoder.AutoEncoder(hidden_neuron_list=[3, 32, 32, 3], hidden_activation_name='relu',
+                                                 epoch_num=100, batch_size=32, contamination=contamination,
+                                                 verbose=0)
+    if name == 'recon':
+        from reconstruction import ReconstructionDetector
+        return _scaled, ReconstructionDetector(n_components=2, contamination=contamination)
+    raise ValueError('Unknown detector: {}'.format(name))
+
+
+def _fit_and_score(name, df, contamination):
+    if name == 'sigma':
+        values = df[FEATURES].to_numpy()
+        start = time.perf_counter()
+        mean, std = values.mean(axis=0), values.std(axis=0, ddof=1)
+        fit_time = time.perf_counter() - start
+        start = time.perf_counter()
+        flagged = (np.abs(values - mean) > 3 * std).any(axis=1)
+        return fit_time, time.perf_counter() - start, flagged
+
+    from score_cache import labels_from_scores, higher_is_anomalous
+    prepare, model = _make_detector(name, contamination)
+    X = prepare(df)
+    start = time.perf_counter()
+    model.fit(X)
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    scores = model.decision_function(X)
+    score_time = time.perf_counter() - start
+    labels = labels_from_scores(model, scores)
+    flagged = labels == (1 if higher_is_anomalous(model) else -1)
+    return fit_time, score_time, flagged
+
+
+def run_case(name, n_rows, contamination=0.01, random_state=0):
+    """Benchmark one detector on one size; meant to run in its own process."""
+    df, truth = synthetic_transactions(n_rows, sample_profile(), random_state=random_state)
+    result = {'detector': name, 'rows': n_rows}
+    try:
+        fit_time, score_time, flagged = _fit_and_score(name, df, contamination)
+    except ImportError as exc:
+        result['error'] = 'missing dependency: {}'.format(exc)
+        return result
+    except Exception as exc:
+        # e.g. CBLOF failing to separate the clusters; the other cases still run
+        result['error'] = '{}: {}'.format(type(exc).__name__, exc)
+        return result
+    true_positives = int((flagged & truth).sum())
+    result.update({
+        'fit_seconds': fit_time,
+        'score_seconds': score_time,
+        'rows_per_second': n_rows / score_time if score_time > 0 else None,
+        'flagged': int(flagged.sum()),
+        'precision': true_positives / flagged.sum() if flagged.any() else 0.0,
+        'recall': true_positives / truth.sum() if truth.any() else 0.0,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin'
+                                                                             else 1024),
+    })
+    return result
+
+
+def run_benchmarks(detectors, sizes, contamination=0.01, max_rows=None):
+    max_rows = dict(DEFAULT_MAX_ROWS, **(max_rows or {}))
+    results = []
+    for n_rows in sizes:
+        for name in detectors:
+            limit = max_rows.get(name)
+            if limit is not None and n_rows > limit:
+                results.append({'detector': name, 'rows': n_rows, 'skipped': 'above max rows {}'.format(limit)})
+                continue
+            try:
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    result = pool.submit(run_case, name, n_rows, contamination).result()
+            except Exception as exc:
+                # the worker itself died (out of memory, ...)
+                result = {'detector': name, 'rows': n_rows, 'error': '{}: {}'.format(type(exc).__name__, exc)}
+            print(json.dumps(result), flush=True)
+            results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the anomaly detectors on synthetic transactions.')
+    parser.add_argument('--detectors', nargs='+', default=list(DEFAULT_MAX_ROWS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--contamination', type=float, default=0.01)
+    parser.add_argument('--no-limits', action='store_true', help='run slow detectors on every size')
+    parser.add_argument('--out', default='bench_output.json')
+    args = parser.parse_args(argv)
+
+    max_rows = {name: None for name in args.detectors} if args.no_limits else None
+    results = run_benchmarks(args.detectors, args.sizes, args.contamination, max_rows)
+    report = {'python': platform.python_version(), 'machine': platform.machine(),
+              'contamination': args.contamination, 'results': results}
+    with open(args.out, 'w') as fh:
+        json.dump(report, fh, indent=2)
+    print('Results written to', args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
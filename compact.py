@@ -0,0 +1,82 @@
+"""
+Memory-lean representation of the transactions.
+
+The loaded frame keeps every text column (City, Category, Sub-Category, Product Name, ...) as Python strings and all
+numerics as 64-bit. compact_frame() stores repetitive text as pandas categoricals and numerics in 32-bit types, and
+FeatureMatrix keeps the scaled detector features in one contiguous float32 array that all detectors share - outlier
+flags are kept as separate boolean masks instead of copying the frame once per detector.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def compact_frame(df, max_category_ratio=0.5, float_dtype=np.float32):
+    """
+    Return a compact version of `df`.
+
+    Text columns whose number of distinct values is at most `max_category_ratio` of the rows become categoricals,
+    floats become `float_dtype` and integers are downcast to the smallest type that holds them.
+    """
+    columns = {}
+    for name, column in df.items():
+        if pd.api.types.is_bool_dtype(column) or isinstance(column.dtype, pd.CategoricalDtype):
+            columns[name] = column
+        elif pd.api.types.is_float_dtype(column):
+            columns[name] = column.astype(float_dtype)
+        elif pd.api.types.is_integer_dtype(column):
+            columns[name] = pd.to_numeric(column, downcast='integer')
+        elif pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column):
+            if column.nunique(dropna=False) <= max_category_ratio * max(len(column), 1):
+                columns[name] = column.astype('category')
+            else:
+                columns[name] = column
+        else:
+            columns[name] = column
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_usage_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+class FeatureMatrix:
+    """
+    Detector features in one C-contiguous float32 array, min-max scaled in place.
+
+    frame() returns a DataFrame view on the same memory (no copy), so every detector reads the same buffer;
+    results are kept as boolean masks in `flags`.
+    """
+
+    def __init__(self, df, columns, feature_range=(0, 1), dtype=np.float32):
+        self.columns = list(columns)
+        self.index = df.index
+        self.values = np.empty((len(df), len(self.columns)), dtype=dtype)
+        for position, column in enumerate(self.columns):
+            self.values[:, position] = df[column].to_numpy()
+        self.data_min_ = self.values.min(axis=0)
+        self.data_max_ = self.values.max(axis=0)
+        self.feature_range = feature_range
+        self._scale_in_place()
+        self.flags = {}
+
+    def _scale_in_place(self):
+        low, high = self.feature_range
+        span = self.data_max_ - self.data_min_
+        span[span == 0] = 1
+        self.scale_ = (high - low) / span
+        self.values -= self.data_min_
+        self.values *= self.scale_
+        self.values += low
+
+    def transform(self, df):
+        """Scale new rows with the fitted min / max (like MinMaxScaler.transform)."""
+        values = np.column_stack([df[column].to_numpy(dtype=self.values.dtype) for column in self.columns])
+        return (values - self.data_min_) * self.scale_ + self.feature_range[0]
+
+    def frame(self):
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+
+    def set_flags(self, name, mask):
+        self.flags[name] = np.asarray(mask, dtype=bool)
+        return self.flags[name]
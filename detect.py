@@ -0,0 +1,167 @@
+"""
+Headless batch entry point.
+
+    python detect.py --method sigma --columns Sales Profit --out outliers.csv
+    python detect.py --method cblof --columns Discount Profit --contamination 0.01 --out outliers.parquet
+
+Unlike anomaly_detection_mini_project.py nothing is plotted and nothing runs at import time. scikit-learn, pyod and
+the autoencoder's deep-learning backend are only imported by the method that needs them, so a sigma-only run just
+pays for pandas.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from instrumentation import stage
+
+METHODS = ('sigma', 'iforest', 'cblof', 'ae', 'recon')
+
+
+def sigma_scores(data, n_sigma=3):
+    # largest absolute z-score over the requested columns; outliers are beyond n_sigma on any of them
+    values = data.to_numpy(dtype=np.float64)
+    with stage('fit', rows=len(values), method='sigma'):
+        mean, std = values.mean(axis=0), values.std(axis=0, ddof=1)
+    with stage('score', rows=len(values), method='sigma'):
+        scores = (np.abs(values - mean) / std).max(axis=1)
+    with stage('threshold', rows=len(values), method='sigma'):
+        return scores, scores > n_sigma
+
+
+def _scaled(data):
+    from sklearn.preprocessing import MinMaxScaler
+    return MinMaxScaler(feature_range=(0, 1)).fit_transform(data)
+
+
+def build_model(method, n_columns, contamination, random_state=42):
+    if method == 'iforest':
+        if n_columns == 1:
+            from univariate_iforest import UnivariateIsolationForest
+            return UnivariateIsolationForest(n_estimators=100, contamination=contamination, random_state=random_state)
+        from sklearn.ensemble import IsolationForest
+        return IsolationForest(n_estimators=100, contamination=contamination, random_state=random_state)
+    if method == 'cblof':
+        from pyod.models import cblof
+        return cblof.CBLOF(contamination=contamination, random_state=random_state)
+    if method == 'ae':
+        from pyod.models import auto_encoder
+        # pyod >= 2 (PyTorch) constructor arguments
+        return auto_encoder.AutoEncoder(hidden_neuron_list=[n_columns, 32, 32, n_columns],
+                                        hidden_activation_name='relu',
+                                        epoch_num=100,
+                                        batch_size=32,
+                                        contamination=contamination,
+                                        random_state=random_state,
+                                        verbose=0)
+    if method == 'recon':
+        from reconstruction import ReconstructionDetector
+        return ReconstructionDetector(n_components=max(n_columns - 1, 1), contamination=contamination)
+    raise ValueError('Unknown method: {}'.format(method))
+
+
+def model_scores(method, data, contamination, use_registry=True, n_jobs=1):
+    import pandas as pd
+    from parallel_scoring import parallel_decision_function
+    from score_cache import higher_is_anomalous
+
+    with stage('scale', rows=len(data)):
+        X = pd.DataFrame(_scaled(data) if method != 'iforest' else data.to_numpy(), columns=data.columns)
+    model = build_model(method, X.shape[1], contamination)
+    with stage('fit', rows=len(X), method=method):
+        if use_registry:
+            from model_registry import get_or_fit
+            model = get_or_fit(model, X)
+        else:
+            model.fit(X)
+    with stage('score', rows=len(X), method=method):
+        scores = parallel_decision_function(model, X, n_jobs)
+    with stage('threshold', rows=len(X), method=method):
+        if higher_is_anomalous(model):
+            return scores, scores > model.threshold_
+        return -scores, scores < 0
+
+
+def run(method, columns, source=None, n_sigma=3, contamination=0.01, use_registry=True, n_jobs=1,
+        extra_columns=()):
+    """Score the dataset and return the full frame with 'Score' and 'Outlier' columns added."""
+    from superstore_cache import DEFAULT_DATASET, load_superstore
+    from topk import REPORT_COLUMNS
+
+    wanted = list(dict.fromkeys(REPORT_COLUMNS + list(extra_columns) + list(columns)))
+    with stage('load') as load_stage:
+        df = load_superstore(source or DEFAULT_DATASET, columns=wanted)
+        load_stage.add_rows(len(df))
+    if method == 'sigma':
+        scores, outliers = sigma_scores(df[columns], n_sigma)
+    else:
+        scores, outliers = model_scores(method, df[columns], contamination, use_registry, n_jobs)
+    df['Score'] = scores
+    df['Outlier'] = outliers
+    return df
+
+
+def write_result(df, path):
+    if path.endswith('.parquet'):
+        df.to_parquet(path)
+    elif path.endswith('.json'):
+        df.to_json(path, orient='records', lines=True, date_format='iso')
+    else:
+        df.to_csv(path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Detect anomalous Superstore transactions without plotting.')
+    parser.add_argument('--method', choices=METHODS, default='sigma')
+    parser.add_argument('--columns', nargs='+', default=['Sales'], help='feature columns (default: Sales)')
+    parser.add_argument('--input', default=None, help='Superstore workbook (default: the bundled sample)')
+    parser.add_argument('--out', default=None, help='write results to .csv, .parquet or .json (lines)')
+    parser.add_argument('--all', action='store_true', help='write every row, not only the outliers')
+    parser.add_argument('--n-sigma', type=float, default=3.0)
+    parser.add_argument('--contamination', type=float, default=0.01)
+    parser.add_argument('--no-registry', action='store_true', help='always refit instead of using the model registry')
+    parser.add_argument('--jobs', type=int, default=1, help='score in this many processes (0: all cores)')
+    parser.add_argument('--store', default=None, help='append the run to this SQLite result store')
+    parser.add_argument('--top', type=int, default=10, help='number of top outliers to print')
+    parser.add_argument('--trace', default=None, help='write a per-stage timing/memory trace to this file')
+    parser.add_argument('--trace-format', choices=('jsonl', 'chrome'), default='jsonl')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace:
+        from instrumentation import enable
+        enable(args.trace, args.trace_format)
+    start = time.perf_counter()
+    extra_columns = ()
+    if args.store:
+        from result_store import STORE_COLUMNS
+        extra_columns = [source for source, _ in STORE_COLUMNS]
+    df = run(args.method, args.columns, args.input, args.n_sigma, args.contamination, not args.no_registry,
+             args.jobs or None, extra_columns)
+
+    from topk import top_k_rows
+    with stage('report', rows=len(df)):
+        print('Total Outliers:', int(df['Outlier'].sum()), 'of', len(df))
+        if args.top:
+            print(top_k_rows(df, 'Score', args.top, columns=list(dict.fromkeys(args.columns + ['Score'])),
+                             rows=df['Outlier'].to_numpy()).to_string())
+        if args.out:
+            write_result(df if args.all else df[df['Outlier']], args.out)
+            print('Results written to', args.out)
+        if args.store:
+            from result_store import ResultStore
+            with ResultStore(args.store) as store:
+                run_id = store.append_run(df, df['Score'].to_numpy(), df['Outlier'].to_numpy(), args.method,
+                                          params={'columns': args.columns, 'n_sigma': args.n_sigma,
+                                                  'contamination': args.contamination})
+            print('Run {} appended to {}'.format(run_id, args.store))
+    print('Elapsed: {:.3f}s'.format(time.perf_counter() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Multi-detector ensemble.
+
+Section 4 of the notebook trains CBLOF, Isolation Forest and the AutoEncoder one after the other on the same scaled
+Discount/Profit matrix. The ensemble runner fits and scores them concurrently in a process pool (the feature matrix
+is placed in shared memory once, workers read it in place), brings every detector's decision scores to a common
+scale and combines them into a single anomaly score and verdict. Detectors passed in already fitted are scored, not
+refit, so the combined verdict comes from exactly the models the caller has been using.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from score_cache import cached_decision_function, higher_is_anomalous
+from shared_arrays import SharedArray
+
+COMBINATIONS = ('average', 'max', 'rank')
+
+
+def anomaly_scores(model, X):
+    """Decision scores oriented so that higher means more anomalous (pyod convention)."""
+    scores = np.asarray(model.decision_function(X), dtype=np.float64)
+    return scores if higher_is_anomalous(model) else -scores
+
+
+def normalize_scores(scores, method='zscore'):
+    if method == 'zscore':
+        std = scores.std()
+        return (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
+    if method == 'minmax':
+        span = scores.max() - scores.min()
+        return (scores - scores.min()) / span if span > 0 else np.zeros_like(scores)
+    if method == 'rank':
+        return (scores.argsort().argsort() + 1) / len(scores)
+    raise ValueError('Unknown normalization: {}'.format(method))
+
+
+def _fit_and_score(name, model, spec, columns, registry_dir):
+    shared = SharedArray.attach(spec)
+    try:
+        X = pd.DataFrame(shared.array, columns=columns, copy=False) if columns is not None else shared.array
+        if registry_dir is not None:
+            from model_registry import ModelRegistry
+            model = ModelRegistry(registry_dir).get_or_fit(model, X)
+        else:
+            model.fit(X)
+        scores = anomaly_scores(model, X)
+    finally:
+        X = None
+        shared.close()
+    return name, model, scores
+
+
+def is_fitted(model):
+    # sklearn's convention (also followed by pyod and the detectors here): fit() sets attributes ending in '_'
+    return any(name.endswith('_') and not name.startswith('__') for name in vars(model))
+
+
+def fit_and_score_all(detectors, X, max_workers=None, registry_dir=None):
+    """
+    Fit `detectors` (a dict of name -> estimator) concurrently on X and score X with each of them.
+
+    Detectors that are already fitted are not refit: they are scored in the calling process through the score
+    cache, so their scores are the ones the caller already saw. Worker processes are only started for unfitted
+    detectors. Returns (scores, fitted_models), both dicts keyed by name; the raw scores are oriented so that higher
+    is more anomalous.
+    """
+    scores, fitted = {}, {}
+    pending = {}
+    for name, model in detectors.items():
+        if is_fitted(model):
+            raw = np.asarray(cached_decision_function(model, X), dtype=np.float64)
+            scores[name] = raw if higher_is_anomalous(model) else -raw
+            fitted[name] = model
+        else:
+            pending[name] = model
+    if pending:
+        columns = list(X.columns) if isinstance(X, pd.DataFrame) else None
+        # keep X's dtype: the registry keys on the data fingerprint, which a cast to float64 would change
+        values = np.ascontiguousarray(X)
+        with SharedArray.from_array(values) as shared:
+            with ProcessPoolExecutor(max_workers=max_workers or len(pending)) as pool:
+                futures = [pool.submit(_fit_and_score, name, model, shared.spec, columns, registry_dir)
+                           for name, model in pending.items()]
+                for future in futures:
+                    name, model, raw = future.result()
+                    fitted[name] = model
+                    scores[name] = raw
+    # keep the caller's order of detectors
+    return {name: scores[name] for name in detectors}, {name: fitted[name] for name in detectors}
+
+
+def run_ensemble(detectors, X, combination='average', contamination=0.01, max_workers=None,
+                 registry_dir=None):
+    """
+    Fit and score `detectors` (a dict of name -> estimator) concurrently on X; fitted ones are only scored.
+
+    Returns (scores_df, fitted_models) where scores_df has one normalized score column per detector, a 'Combined'
+    score and an 'Outlier' column (1 for the top `contamination` fraction of the combined score, as in pyod).
+    """
+    if combination not in COMBINATIONS:
+        raise ValueError('combination must be one of {}'.format(COMBINATIONS))
+    index = X.index if isinstance(X, pd.DataFrame) else None
+    scores, fitted = fit_and_score_all(detectors, X, max_workers, registry_dir)
+
+    norm = 'rank' if combination == 'rank' else 'zscore'
+    scores_df = pd.DataFrame({name: normalize_scores(raw, norm) for name, raw in scores.items()}, index=index)
+    if combination == 'max':
+        combined = scores_df.max(axis=1)
+    else:
+        combined = scores_df.mean(axis=1)
+    threshold = np.percentile(combined, 100 * (1 - contamination))
+    scores_df['Combined'] = combined
+    scores_df['Outlier'] = (combined > threshold).astype(int)
+    return scores_df, fitted
@@ -0,0 +1,149 @@
+"""
+Pre-aggregated, downsampled plotting.
+
+sns.lineplot(x=df['Order Date'], y=df['Sales']) groups every transaction by date and bootstraps a confidence interval
+per date, and sns.distplot() runs a full KDE over every value each time one of the repeated distribution plots is
+drawn. The helpers here draw the same pictures from small precomputed summaries instead:
+
+    daily_rollup()    mean / std / count per date in one groupby; the 95% band is the normal approximation
+                      mean +/- 1.96 * std / sqrt(count) instead of a bootstrap
+    rollup_lineplot() draws a rollup, downsampled with LTTB (largest triangle three buckets) to about one point per
+                      horizontal pixel of the axes
+    histplot()        a binned histogram with a binned KDE (a Gaussian kernel convolved with counts on a fine grid),
+                      cached per (values, bins) so the Sales / Profit outlier-region plots reuse the same bins
+
+Past the single aggregation / binning pass, drawing costs depend on the axes' size and the number of bins, not on
+the rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+from model_registry import data_fingerprint
+
+# z of a two-sided 95% normal interval, seaborn's default ci
+Z_95 = 1.959963984540054
+
+
+def lttb(x, y, n_out):
+    """
+    Indices of `n_out` points of (x, y) chosen by Largest-Triangle-Three-Buckets (Steinarsson, 2013).
+
+    The first and last points are kept; every bucket in between contributes the point that forms the largest
+    triangle with the previously selected point and the average of the next bucket, which preserves peaks.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # n_out - 2 buckets over the inner points, followed by a one-point "bucket" holding the last point
+    edges = np.append(np.linspace(1, n - 1, n_out - 1).astype(np.int64), n)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_x, next_y = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        area = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous])
+                      - (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+        previous = lo + int(area.argmax())
+        selected[i + 1] = previous
+    return selected
+
+
+def daily_rollup(df, column, date_column='Order Date', freq='D'):
+    """Mean, std, count and 95% interval of `column` per `freq` bucket (buckets without transactions dropped)."""
+    rollup = df.groupby(pd.Grouper(key=date_column, freq=freq))[column].agg(['mean', 'std', 'count'])
+    rollup = rollup[rollup['count'] > 0]
+    half_width = Z_95 * rollup['std'].fillna(0.0) / np.sqrt(rollup['count'])
+    rollup['lower'] = rollup['mean'] - half_width
+    rollup['upper'] = rollup['mean'] + half_width
+    rollup.columns.name = column
+    return rollup
+
+
+def rollup_lineplot(rollup, ax=None, max_points=None, ci=True, label=None):
+    """Line (and 95% band) of a daily_rollup(), LTTB-downsampled to `max_points` (default: the axes' pixel width)."""
+    import matplotlib.pyplot as plt
+
+    if ax is None:
+        _, ax = plt.subplots(1, 1, figsize=(12, 6))
+    if max_points is None:
+        max_points = max(int(ax.bbox.width), 3)
+    dates = rollup.index.to_numpy()
+    keep = lttb(dates.astype('datetime64[ns]').astype(np.int64), rollup['mean'].to_numpy(), max_points)
+    line, = ax.plot(dates[keep], rollup['mean'].to_numpy()[keep], label=label)
+    if ci:
+        ax.fill_between(dates[keep], rollup['lower'].to_numpy()[keep], rollup['upper'].to_numpy()[keep],
+                        color=line.get_color(), alpha=.2, linewidth=0)
+    ax.set_xlabel(rollup.index.name)
+    ax.set_ylabel(rollup.columns.name)
+    return ax
+
+
+# upper bound on the grid the binned KDE is evaluated on
+MAX_KDE_POINTS = 16_384
+
+
+def _binned_kde(values):
+    """
+    Gaussian KDE with Scott's bandwidth (as sns.distplot), evaluated on a regular grid of (x, density).
+
+    The values are binned once on a grid fine enough to resolve the bandwidth and the kernel is convolved with the
+    bin counts, so the cost after binning depends on the grid size only.
+    """
+    from scipy.signal import fftconvolve
+
+    n = len(values)
+    bandwidth = values.std(ddof=1) * n ** (-1 / 5) if n > 1 else 0.0
+    low, high = values.min() - 3 * bandwidth, values.max() + 3 * bandwidth
+    if bandwidth == 0 or high <= low:
+        return np.array([low]), np.array([np.inf])
+    n_points = int(min(max(np.ceil(4 * (high - low) / bandwidth), 64), MAX_KDE_POINTS))
+    counts, edges = np.histogram(values, bins=n_points, range=(low, high))
+    width = edges[1] - edges[0]
+    sigma_bins = bandwidth / width
+    offsets = np.arange(-int(np.ceil(4 * sigma_bins)), int(np.ceil(4 * sigma_bins)) + 1)
+    kernel = np.exp(-0.5 * (offsets / sigma_bins) ** 2)
+    density = fftconvolve(counts / (n * width), kernel / kernel.sum(), mode='same')
+    return (edges[:-1] + edges[1:]) / 2, np.clip(density, 0, None)
+
+
+class HistogramCache:
+    """Histogram counts and edges plus the binned KDE grid per (values, bins), computed on first use."""
+
+    def __init__(self):
+        self._histograms = {}
+
+    def histogram(self, values, bins=100):
+        values = np.asarray(values, dtype=np.float64)
+        key = (data_fingerprint(values), bins)
+        if key not in self._histograms:
+            values = values[~np.isnan(values)]
+            counts, edges = np.histogram(values, bins=bins)
+            self._histograms[key] = counts, edges, _binned_kde(values)
+        return self._histograms[key]
+
+    def clear(self):
+        self._histograms = {}
+
+
+histogram_cache = HistogramCache()
+
+
+def histplot(values, ax=None, bins=100, kde=True, cache=histogram_cache):
+    """Density histogram (and KDE) in the style of sns.distplot, drawn from cached bins."""
+    import matplotlib.pyplot as plt
+
+    if ax is None:
+        ax = plt.gca()
+    counts, edges, (grid, density) = cache.histogram(values, bins)
+    ax.stairs(counts / (counts.sum() * np.diff(edges)), edges, fill=True, alpha=.4)
+    if kde:
+        keep = lttb(grid, density, max(int(ax.bbox.width), 3))
+        ax.plot(grid[keep], density[keep])
+    if isinstance(values, pd.Series):
+        ax.set_xlabel(values.name)
+    ax.set_ylabel('Density')
+    return ax
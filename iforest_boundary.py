@@ -0,0 +1,114 @@
+"""
+Exact decision boundary of a univariate Isolation Forest.
+
+With a single feature every tree splits the real line at its thresholds, so the forest's anomaly score is a step
+function that is constant between consecutive split points of all trees. Instead of scoring np.linspace(min, max,
+len(df)) with decision_function() and predict(), the step function is read straight from the fitted trees: each leaf
+covers an interval of the line and contributes its path length to that interval, and the contributions of all leaves
+are summed with a difference array over the sorted split points.
+"""
+
+import numpy as np
+
+EULER_GAMMA = 0.5772156649015329
+
+
+def average_path_length(n_samples):
+    """c(n): average path length of an unsuccessful BST search, as in the Isolation Forest paper / sklearn."""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+    result[n_samples == 2] = 1.0
+    big = n_samples > 2
+    result[big] = 2.0 * (np.log(n_samples[big] - 1.0) + EULER_GAMMA) - 2.0 * (n_samples[big] - 1.0) / n_samples[big]
+    return result
+
+
+def tree_leaf_intervals(tree):
+    """Return (lower, upper, path_length) arrays for every leaf of a fitted sklearn tree on one feature."""
+    left, right = tree.children_left, tree.children_right
+    threshold, n_node_samples = tree.threshold, tree.n_node_samples
+    lowers, uppers, depths, leaves = [], [], [], []
+    stack = [(0, -np.inf, np.inf, 0)]
+    while stack:
+        node, lower, upper, depth = stack.pop()
+        if left[node] == -1:
+            lowers.append(lower)
+            uppers.append(upper)
+            depths.append(depth)
+            leaves.append(node)
+            continue
+        # sklearn sends x <= threshold to the left child
+        stack.append((left[node], lower, min(upper, threshold[node]), depth + 1))
+        stack.append((right[node], max(lower, threshold[node]), upper, depth + 1))
+    path_length = np.asarray(depths, dtype=np.float64) + average_path_length(n_node_samples[leaves])
+    return np.asarray(lowers), np.asarray(uppers), path_length
+
+
+def step_function(model):
+    """
+    Return (breakpoints, decision_values) for a fitted univariate IsolationForest.
+
+    decision_values[k] is model.decision_function(x) for every x in (breakpoints[k-1], breakpoints[k]], with
+    breakpoints[-1] = -inf and breakpoints[len(breakpoints)] = +inf, so len(decision_values) == len(breakpoints) + 1.
+    """
+    if model.n_features_in_ != 1:
+        raise ValueError('step_function needs a model fitted on a single feature')
+    leaves = [tree_leaf_intervals(estimator.tree_) for estimator in model.estimators_]
+    breakpoints = np.unique(np.concatenate([tree.threshold[tree.children_left != -1]
+                                            for tree in (estimator.tree_ for estimator in model.estimators_)]))
+    n_intervals = len(breakpoints) + 1
+    diff = np.zeros(n_intervals + 1)
+    for lowers, uppers, path_length in leaves:
+        # a leaf (lower, upper] covers intervals start..stop-1 of the global partition
+        start = np.where(np.isneginf(lowers), 0, np.searchsorted(breakpoints, lowers) + 1)
+        stop = np.where(np.isposinf(uppers), n_intervals, np.searchsorted(breakpoints, uppers) + 1)
+        np.add.at(diff, start, path_length)
+        np.add.at(diff, stop, -path_length)
+    mean_path = np.cumsum(diff[:-1]) / len(model.estimators_)
+    score_samples = -2.0 ** (-mean_path / average_path_length([model.max_samples_])[0])
+    return breakpoints, score_samples - model.offset_
+
+
+def decision_function_1d(breakpoints, decision_values, x):
+    """Evaluate the step function at x (anything array-like with one column)."""
+    x = np.asarray(x, dtype=np.float64).ravel()
+    return decision_values[np.searchsorted(breakpoints, x, side='left')]
+
+
+def outlier_intervals(model, breakpoints=None, decision_values=None):
+    """Merged (lower, upper] intervals of the line that the model labels as outliers (decision_function < 0)."""
+    if breakpoints is None:
+        breakpoints, decision_values = step_function(model)
+    edges = np.concatenate([[-np.inf], breakpoints, [np.inf]])
+    is_outlier = decision_values < 0
+    intervals = []
+    for k in np.flatnonzero(is_outlier):
+        if intervals and intervals[-1][1] == edges[k]:
+            intervals[-1][1] = edges[k + 1]
+        else:
+            intervals.append([edges[k], edges[k + 1]])
+    return [(float(lower), float(upper)) for lower, upper in intervals]
+
+
+def plot_outlier_region(model, x_min, x_max, xlabel, ax=None):
+    """Plot the anomaly score step function and the outlier region between x_min and x_max."""
+    import matplotlib.pyplot as plt
+
+    if ax is None:
+        _, ax = plt.subplots(1, 1, figsize=(12, 6))
+    breakpoints, decision_values = step_function(model)
+    inside = (breakpoints > x_min) & (breakpoints < x_max)
+    first = np.searchsorted(breakpoints, x_min, side='right')
+    edges = np.concatenate([[x_min], breakpoints[inside], [x_max]])
+    values = decision_values[first:first + len(edges) - 1]
+    ax.stairs(values, edges, label='anomaly score', baseline=None)
+    label = 'outlier region'
+    for lower, upper in outlier_intervals(model, breakpoints, decision_values):
+        lower, upper = max(lower, x_min), min(upper, x_max)
+        if lower < upper:
+            ax.axvspan(lower, upper, color='r', alpha=.4, label=label)
+            label = None
+    ax.legend()
+    ax.set_ylabel('anomaly score')
+    ax.set_xlabel(xlabel)
+    return ax
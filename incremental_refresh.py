@@ -0,0 +1,203 @@
+"""
+Incremental model refresh over a sliding window.
+
+When a new month of orders lands, the notebook's IsolationForest(n_estimators=100) has to be refit on the whole
+history. SlidingIsolationForest instead grows the fitted forest with warm_start by `trees_per_refresh` trees trained
+on the new rows and retires the same number of its oldest trees, so the forest always describes the most recent
+n_estimators / trees_per_refresh refreshes and follows drift. A refresh costs the new data plus the scoring of a
+bounded sample of the window (for the contamination cutoff), independent of the length of the history.
+
+WindowedStats keeps the three-sigma moments (streaming_sigma.RunningStats) and the min / max behind the MinMaxScaler
+per refresh and merges the ones still inside the window, so the sigma thresholds and the scaler slide along with the
+forest. IncrementalRefresh bundles the three:
+
+    refresher = IncrementalRefresh(['Sales', 'Profit'], contamination=0.01).fit(history)
+    refresher.refresh(new_month)
+    refresher.forest.predict(new_month[['Sales', 'Profit']])
+    refresher.stats.thresholds('Sales')
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from streaming_sigma import RunningStats
+
+# fitted attributes of sklearn's IsolationForest that hold one entry per tree (_seeds is rebuilt by every warm-start
+# fit and only holds the latest trees' seeds, so it is not sliced)
+_PER_TREE_ATTRIBUTES = ('estimators_', 'estimators_features_', '_average_path_length_per_tree',
+                        '_decision_path_lengths')
+
+
+class SlidingIsolationForest:
+    """
+    IsolationForest whose trees cover the last n_estimators / trees_per_refresh refreshes (sklearn convention).
+
+    Every refresh keeps a uniform sample of at most `sample_size` of its rows (the initial fit counts as one batch).
+    The samples of the batches inside the window serve two purposes: the contamination cutoff is the weighted
+    percentile of their scores, i.e. of the windowed history rather than of one (possibly small) month, and a month
+    with fewer rows than the initial max_samples_ is topped up with the most recent sampled rows, so every tree is
+    grown on the same number of samples and c(max_samples_) normalizes all of them correctly.
+    """
+
+    def __init__(self, n_estimators=100, trees_per_refresh=10, max_samples='auto', contamination='auto',
+                 sample_size=1024, random_state=None):
+        if not 0 < trees_per_refresh <= n_estimators:
+            raise ValueError('trees_per_refresh must be between 1 and n_estimators')
+        self.n_estimators = n_estimators
+        self.trees_per_refresh = trees_per_refresh
+        self.max_samples = max_samples
+        self.contamination = contamination
+        self.sample_size = sample_size
+        self.random_state = random_state
+
+    def get_params(self, deep=True):
+        return {name: getattr(self, name) for name in (
+            'n_estimators', 'trees_per_refresh', 'max_samples', 'contamination', 'sample_size', 'random_state')}
+
+    def fit(self, X, y=None):
+        """Initial fit on the history available so far."""
+        from sklearn.ensemble import IsolationForest
+
+        self._rng = np.random.default_rng(self.random_state)
+        self.forest_ = IsolationForest(n_estimators=self.n_estimators, max_samples=self.max_samples,
+                                       contamination=self.contamination, random_state=self._next_seed(),
+                                       warm_start=True).fit(X)
+        # later generations of trees are grown on exactly as many samples as the first one
+        self.max_samples_ = self.forest_.max_samples_
+        self.forest_.set_params(max_samples=self.max_samples_)
+        self._samples = deque(maxlen=self.n_estimators // self.trees_per_refresh)
+        self._add_sample(X)
+        self.n_refreshes_ = 0
+        return self
+
+    def _next_seed(self):
+        # bagging draws the new trees' seeds after skipping len(estimators_) draws, which is constant once the window
+        # is full - a fresh seed per refresh keeps successive generations of trees independent
+        return int(self._rng.integers(np.iinfo(np.int32).max))
+
+    def _add_sample(self, X):
+        values = np.asarray(X)
+        if len(values) > self.sample_size:
+            values = values[np.sort(self._rng.choice(len(values), self.sample_size, replace=False))]
+        # each sampled row stands for len(X) / len(sample) rows of its batch
+        self._samples.append((values, len(X) / len(values)))
+
+    def _as_input(self, values, like):
+        if hasattr(like, 'columns'):
+            return pd.DataFrame(values, columns=like.columns)
+        return values
+
+    def refresh(self, X_new):
+        """Train `trees_per_refresh` trees on X_new and retire as many of the oldest ones."""
+        forest = self.forest_
+        X_fit = X_new
+        shortfall = self.max_samples_ - len(X_new)
+        if shortfall > 0:
+            # top a small batch up with the most recent sampled rows so the new trees keep the depth limit and the
+            # normalization of the rest of the forest
+            recent = np.concatenate([values for values, _ in reversed(self._samples)])[:shortfall]
+            X_fit = self._as_input(np.concatenate([np.asarray(X_new), recent]), X_new)
+        forest.set_params(n_estimators=len(forest.estimators_) + self.trees_per_refresh,
+                          random_state=self._next_seed(), contamination='auto')
+        # warm_start keeps the existing trees and fits only the missing ones, on the data passed here
+        forest.fit(X_fit)
+        self._retire(len(forest.estimators_) - self.n_estimators)
+        forest.set_params(contamination=self.contamination)
+        self._add_sample(X_new)
+        if self.contamination != 'auto':
+            forest.offset_ = self._window_offset(X_new)
+        self.n_refreshes_ += 1
+        return self
+
+    def _window_offset(self, like):
+        # weighted contamination percentile of the current trees' scores over the window's samples
+        samples = np.concatenate([values for values, _ in self._samples])
+        scores = self.forest_.score_samples(self._as_input(samples, like))
+        weights = np.concatenate([np.full(len(values), weight) for values, weight in self._samples])
+        order = np.argsort(scores)
+        cumulative = np.cumsum(weights[order])
+        position = np.searchsorted(cumulative, self.contamination * cumulative[-1])
+        return float(scores[order][min(position, len(scores) - 1)])
+
+    def _retire(self, n_trees):
+        if n_trees <= 0:
+            return
+        for name in _PER_TREE_ATTRIBUTES:
+            if hasattr(self.forest_, name):
+                setattr(self.forest_, name, getattr(self.forest_, name)[n_trees:])
+        self.forest_.n_estimators = len(self.forest_.estimators_)
+
+    @property
+    def offset_(self):
+        return self.forest_.offset_
+
+    def score_samples(self, X):
+        return self.forest_.score_samples(X)
+
+    def decision_function(self, X):
+        return self.forest_.decision_function(X)
+
+    def predict(self, X):
+        return self.forest_.predict(X)
+
+
+class WindowedStats:
+    """Per-column moments and min / max of the last `window` batches."""
+
+    def __init__(self, columns, window=10):
+        self.columns = list(columns)
+        self.window = window
+        self.batches = deque(maxlen=window)
+
+    def update(self, df):
+        values = df[self.columns].to_numpy(dtype=np.float64)
+        stats = [RunningStats().update(values[:, i]) for i in range(len(self.columns))]
+        # the oldest batch drops out of the deque automatically once the window is full
+        self.batches.append((stats, np.nanmin(values, axis=0), np.nanmax(values, axis=0)))
+        return self
+
+    def running_stats(self, column):
+        i = self.columns.index(column)
+        total = RunningStats()
+        for stats, _, _ in self.batches:
+            total.merge(stats[i])
+        return total
+
+    def thresholds(self, column, n_sigma=3):
+        return self.running_stats(column).thresholds(n_sigma)
+
+    def scaler(self, feature_range=(0, 1)):
+        """MinMaxScaler over the window; fitting it on the window's min and max rows is exact."""
+        from sklearn.preprocessing import MinMaxScaler
+
+        mins = np.min([batch_min for _, batch_min, _ in self.batches], axis=0)
+        maxs = np.max([batch_max for _, _, batch_max in self.batches], axis=0)
+        return MinMaxScaler(feature_range=feature_range).fit(pd.DataFrame([mins, maxs], columns=self.columns))
+
+
+class IncrementalRefresh:
+    """Sliding-window IsolationForest, three-sigma statistics and scaler, refreshed together."""
+
+    def __init__(self, columns, n_estimators=100, trees_per_refresh=10, contamination='auto', random_state=None):
+        self.columns = list(columns)
+        self.forest = SlidingIsolationForest(n_estimators, trees_per_refresh, contamination=contamination,
+                                             random_state=random_state)
+        # the initial fit counts as one batch, so the statistics retire it together with its trees
+        self.stats = WindowedStats(self.columns, window=n_estimators // trees_per_refresh)
+        self.scaler = None
+
+    def fit(self, df):
+        self.forest.fit(df[self.columns])
+        self.stats.update(df)
+        self.scaler = self.stats.scaler()
+        return self
+
+    def refresh(self, df):
+        # min-max scaling is monotone per feature, which axis-aligned isolation trees are invariant to, so the forest
+        # is trained on the raw columns and does not depend on the sliding scaler
+        self.forest.refresh(df[self.columns])
+        self.stats.update(df)
+        self.scaler = self.stats.scaler()
+        return self
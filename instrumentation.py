@@ -0,0 +1,184 @@
+"""
+Per-stage timing and memory instrumentation.
+
+Wrap pipeline stages (load, scale, fit, score, threshold, report, plot) with
+
+    with stage('fit', rows=len(X)):
+        model.fit(X)
+
+or decorate a function with @traced('score'). When tracing is enabled each stage records wall time, CPU time, rows
+processed and the peak memory allocated inside it (via tracemalloc), and the records are written as JSON lines or as
+a Chrome trace (chrome://tracing, Perfetto). When tracing is disabled stage() returns a shared no-op context manager,
+so instrumented code pays one attribute check per stage.
+
+Tracing is turned on with enable(path) or by setting ANOMALY_TRACE=path (ANOMALY_TRACE_FORMAT=chrome for the
+Chrome format) before the first import.
+"""
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_rows(self, rows):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Tracer:
+
+    def __init__(self, path, fmt='jsonl', track_memory=True):
+        if fmt not in ('jsonl', 'chrome'):
+            raise ValueError("fmt must be 'jsonl' or 'chrome'")
+        self.path = path
+        self.fmt = fmt
+        self.track_memory = track_memory
+        self.records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = False
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if fmt == 'jsonl':
+            # start a fresh trace file, records are appended as stages finish
+            open(path, 'w').close()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def emit(self, record):
+        with self._lock:
+            if self.fmt == 'jsonl':
+                with open(self.path, 'a') as fh:
+                    fh.write(json.dumps(record) + '\n')
+            else:
+                self.records.append(record)
+
+    def close(self):
+        if self.fmt == 'chrome':
+            events = [{'name': record['stage'], 'ph': 'X', 'pid': os.getpid(), 'tid': record['thread'],
+                       'ts': record['start_us'], 'dur': record['wall_seconds'] * 1e6,
+                       'args': {key: record[key] for key in ('rows', 'cpu_seconds', 'peak_alloc_bytes')}}
+                      for record in self.records]
+            with open(self.path, 'w') as fh:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fh)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+
+class Stage:
+
+    def __init__(self, tracer, name, rows=None, **attrs):
+        self.tracer = tracer
+        self.name = name
+        self.rows = rows
+        self.attrs = attrs
+
+    def add_rows(self, rows):
+        self.rows = (self.rows or 0) + rows
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        if self.tracer.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # hand the peak seen so far to the enclosing stage before resetting it for this one
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = self.peak = current
+        stack.append(self)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        stack = self.tracer._stack()
+        stack.pop()
+        peak_alloc = None
+        if self.tracer.track_memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            peak_alloc = self.peak - self.start_memory
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+            tracemalloc.reset_peak()
+        record = {'stage': self.name,
+                  'parent': stack[-1].name if stack else None,
+                  'start_us': (self.start_wall - self.tracer._origin) * 1e6,
+                  'wall_seconds': wall,
+                  'cpu_seconds': cpu,
+                  'rows': self.rows,
+                  'peak_alloc_bytes': peak_alloc,
+                  'thread': threading.get_ident(),
+                  'error': exc_type.__name__ if exc_type is not None else None}
+        record.update(self.attrs)
+        self.tracer.emit(record)
+        return False
+
+
+_tracer = None
+
+
+def enable(path, fmt='jsonl', track_memory=True):
+    global _tracer
+    disable()
+    _tracer = Tracer(path, fmt, track_memory)
+    return _tracer
+
+
+def disable():
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def stage(name, rows=None, **attrs):
+    """Context manager timing one pipeline stage (a no-op when tracing is disabled)."""
+    if _tracer is None:
+        return _NULL_STAGE
+    return Stage(_tracer, name, rows, **attrs)
+
+
+def traced(name=None):
+    """Decorator form of stage(); rows are taken from len() of the first argument when it has one."""
+    def decorate(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            rows = len(args[0]) if args and hasattr(args[0], '__len__') else None
+            with Stage(_tracer, stage_name, rows):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+if os.environ.get('ANOMALY_TRACE'):
+    enable(os.environ['ANOMALY_TRACE'], os.environ.get('ANOMALY_TRACE_FORMAT', 'jsonl'))
+atexit.register(disable)
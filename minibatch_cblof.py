@@ -0,0 +1,134 @@
+"""
+Out-of-core Clustering-Based Local Outlier Factor.
+
+pyod's CBLOF runs full-batch KMeans over the whole matrix. MiniBatchCBLOF clusters with MiniBatchKMeans.partial_fit
+over chunks, keeps only the centroids and the cluster sizes to split large from small clusters (same alpha / beta rule
+as pyod), and scores rows chunk by chunk by their distance to the nearest large-cluster centroid. Memory is bounded
+by the chunk size; the contamination threshold comes from a KLL quantile sketch of the training scores.
+
+The estimator follows the pyod conventions used in the notebook: decision_function() is higher for outliers and
+predict() returns 1 for outliers and 0 for inliers.
+"""
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from quantile_sketch import KLLSketch
+
+
+def _iter_rows(X, chunk_size):
+    X = np.asarray(X)
+    for start in range(0, len(X), chunk_size):
+        yield X[start:start + chunk_size]
+
+
+class MiniBatchCBLOF:
+
+    # pyod convention, see score_cache.higher_is_anomalous
+    outlier_scores_high = True
+
+    def __init__(self, n_clusters=8, contamination=0.1, alpha=0.9, beta=5, use_weights=False, batch_size=4096,
+                 chunk_size=100_000, sketch_k=2000, random_state=None):
+        self.n_clusters = n_clusters
+        self.contamination = contamination
+        self.alpha = alpha
+        self.beta = beta
+        self.use_weights = use_weights
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.sketch_k = sketch_k
+        self.random_state = random_state
+
+    def get_params(self, deep=True):
+        return {name: getattr(self, name) for name in (
+            'n_clusters', 'contamination', 'alpha', 'beta', 'use_weights', 'batch_size', 'chunk_size',
+            'sketch_k', 'random_state')}
+
+    def partial_fit(self, chunk):
+        """Update the centroids with one chunk (first pass)."""
+        if not hasattr(self, 'clustering_estimator_'):
+            self.clustering_estimator_ = MiniBatchKMeans(n_clusters=self.n_clusters, batch_size=self.batch_size,
+                                                         random_state=self.random_state, n_init=3)
+        chunk = np.asarray(chunk, dtype=np.float64)
+        for start in range(0, len(chunk), self.batch_size):
+            self.clustering_estimator_.partial_fit(chunk[start:start + self.batch_size])
+        return self
+
+    def fit(self, X, y=None):
+        """Fit from an in-memory matrix, chunked internally."""
+        return self.fit_chunks(lambda: _iter_rows(X, self.chunk_size))
+
+    def fit_chunks(self, make_chunks):
+        """
+        Fit from data that does not fit in memory.
+
+        `make_chunks` is called three times and must return a fresh iterable of 2-D chunks each time: the first pass
+        updates the centroids, the second counts cluster sizes and the third sketches the training scores for the
+        contamination threshold.
+        """
+        # a new fit starts from fresh centroids; only partial_fit() continues from the current ones
+        self.__dict__.pop('clustering_estimator_', None)
+        for chunk in make_chunks():
+            self.partial_fit(chunk)
+        self.cluster_centers_ = self.clustering_estimator_.cluster_centers_
+
+        sizes = np.zeros(self.n_clusters, dtype=np.int64)
+        for chunk in make_chunks():
+            sizes += np.bincount(self._assign(chunk)[0], minlength=self.n_clusters)
+        self.cluster_sizes_ = sizes
+        self.n_samples_ = int(sizes.sum())
+        self._split_clusters()
+
+        # third pass: the contamination cutoff from a bounded-memory quantile sketch of the training scores
+        sketch = KLLSketch(k=self.sketch_k, random_state=self.random_state)
+        for chunk in make_chunks():
+            sketch.update(self.decision_function(chunk))
+        self.threshold_ = float(sketch.quantile(1 - self.contamination))
+        return self
+
+    def _assign(self, chunk):
+        chunk = np.asarray(chunk, dtype=np.float64)
+        distances = np.sqrt(((chunk[:, None, :] - self.cluster_centers_[None, :, :]) ** 2).sum(axis=2))
+        return distances.argmin(axis=1), distances
+
+    def _split_clusters(self):
+        # pyod's rule: the large clusters are the biggest ones covering `alpha` of the data, or the ones before a
+        # size ratio of at least `beta`
+        sizes = self.cluster_sizes_
+        order = np.argsort(-sizes)
+        alpha_list, beta_list = [], []
+        for i in range(1, self.n_clusters):
+            if sizes[order[:i]].sum() >= self.n_samples_ * self.alpha:
+                alpha_list.append(i)
+            following = sizes[order[i]]
+            if following == 0 or sizes[order[i - 1]] / following >= self.beta:
+                beta_list.append(i)
+        intersection = np.intersect1d(alpha_list, beta_list)
+        if len(intersection):
+            split = intersection[0]
+        elif alpha_list:
+            split = alpha_list[0]
+        elif beta_list:
+            split = beta_list[0]
+        else:
+            raise ValueError('Could not split the clusters into large and small ones, try other alpha / beta')
+        self.large_cluster_labels_ = order[:split]
+        self.small_cluster_labels_ = order[split:]
+
+    def decision_function(self, X):
+        """Distance to the own centroid for large clusters, to the nearest large centroid for small ones."""
+        X = X.to_numpy() if hasattr(X, 'to_numpy') else np.asarray(X)
+        scores = np.empty(len(X))
+        for start in range(0, len(X), self.chunk_size):
+            chunk = X[start:start + self.chunk_size]
+            labels, distances = self._assign(chunk)
+            large = np.isin(labels, self.large_cluster_labels_)
+            chunk_scores = np.where(large, distances[np.arange(len(labels)), labels],
+                                    distances[:, self.large_cluster_labels_].min(axis=1))
+            if self.use_weights:
+                chunk_scores = chunk_scores * self.cluster_sizes_[labels]
+            scores[start:start + len(chunk)] = chunk_scores
+        return scores
+
+    def predict(self, X):
+        return (self.decision_function(X) > self.threshold_).astype(int)
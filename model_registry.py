@@ -0,0 +1,102 @@
+"""
+Registry of fitted detectors persisted to disk.
+
+Models are keyed by detector type, hyperparameters, feature columns and a fingerprint of the training data, and are
+stored with joblib so that numpy arrays inside the fitted estimators can be memory-mapped on load. Re-running the
+script (or re-executing notebook cells) with unchanged data and settings loads the fitted model instead of training
+it again.
+"""
+
+import hashlib
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+DEFAULT_REGISTRY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_registry')
+
+
+def data_fingerprint(X):
+    """Content hash of a DataFrame / array used for training."""
+    digest = hashlib.sha1()
+    if isinstance(X, pd.DataFrame):
+        digest.update(json.dumps([str(col) for col in X.columns]).encode())
+        X = X.to_numpy()
+    X = np.ascontiguousarray(X)
+    digest.update(str((X.shape, X.dtype.str)).encode())
+    digest.update(X.tobytes() if X.dtype != object else pd.util.hash_array(X.ravel()).tobytes())
+    return digest.hexdigest()
+
+
+def _params_repr(model):
+    # get_params() of sklearn / pyod estimators, nested estimators included via repr
+    params = model.get_params(deep=False) if hasattr(model, 'get_params') else {}
+    return json.dumps({key: repr(value) for key, value in sorted(params.items())})
+
+
+def model_key(model, X):
+    detector = type(model).__module__ + '.' + type(model).__qualname__
+    columns = list(map(str, X.columns)) if isinstance(X, pd.DataFrame) else None
+    payload = json.dumps([detector, _params_repr(model), columns, data_fingerprint(X)])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class ModelRegistry:
+    """Disk-backed cache of fitted models, see get_or_fit()."""
+
+    def __init__(self, registry_dir=DEFAULT_REGISTRY_DIR, mmap_mode='r'):
+        self.registry_dir = registry_dir
+        self.mmap_mode = mmap_mode
+        self._loaded = {}
+
+    def _path(self, key):
+        return os.path.join(self.registry_dir, key + '.joblib')
+
+    def get(self, key):
+        if key in self._loaded:
+            return self._loaded[key]
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        model = joblib.load(path, mmap_mode=self.mmap_mode)
+        self._loaded[key] = model
+        return model
+
+    def put(self, key, model):
+        os.makedirs(self.registry_dir, exist_ok=True)
+        tmp_path = self._path(key) + '.tmp'
+        joblib.dump(model, tmp_path)
+        os.replace(tmp_path, self._path(key))
+        self._loaded[key] = model
+
+    def get_or_fit(self, model, X):
+        """Return a fitted model equivalent to `model.fit(X)`, loading it from the registry when possible."""
+        key = model_key(model, X)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        model.fit(X)
+        self.put(key, model)
+        return model
+
+    def clear(self):
+        self._loaded.clear()
+        if os.path.isdir(self.registry_dir):
+            for name in os.listdir(self.registry_dir):
+                if name.endswith('.joblib'):
+                    os.remove(os.path.join(self.registry_dir, name))
+
+
+_default_registry = None
+
+
+def get_or_fit(model, X, registry=None):
+    """Module-level shortcut using a shared default registry."""
+    global _default_registry
+    if registry is None:
+        if _default_registry is None:
+            _default_registry = ModelRegistry()
+        registry = _default_registry
+    return registry.get_or_fit(model, X)
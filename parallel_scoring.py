@@ -0,0 +1,89 @@
+"""
+Chunked parallel scoring over shared memory.
+
+model.predict(X) / model.decision_function(X) score the whole matrix on one core. parallel_decision_function places
+X in shared memory once, preallocates the output array in shared memory as well and lets a process pool score row
+chunks of it: every worker receives the fitted model once (through the pool initializer), reads its rows in place
+and writes the scores straight into its slice of the output. Only (start, stop) pairs travel through the task queue,
+so no data is pickled per chunk and the scores never have to be gathered and concatenated.
+
+Workers are limited to one BLAS / OpenMP thread each so that n_jobs processes do not oversubscribe the cores.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from score_cache import higher_is_anomalous, labels_from_scores
+from shared_arrays import SharedArray
+
+# below this many rows the pool start-up costs more than it saves
+MIN_PARALLEL_ROWS = 50_000
+
+# per-worker state, set by _init_worker
+_worker = {}
+
+
+def _init_worker(model, in_spec, out_spec, columns, method):
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+    _worker['model'] = model
+    _worker['input'] = SharedArray.attach(in_spec)
+    _worker['output'] = SharedArray.attach(out_spec)
+    _worker['columns'] = columns
+    _worker['method'] = method
+
+
+def _score_chunk(start, stop):
+    chunk = _worker['input'].array[start:stop]
+    if _worker['columns'] is not None:
+        # models fitted on a DataFrame check the feature names
+        chunk = pd.DataFrame(chunk, columns=_worker['columns'], copy=False)
+    scores = getattr(_worker['model'], _worker['method'])(chunk)
+    _worker['output'].array[start:stop] = scores
+    return stop - start
+
+
+def _chunk_bounds(n_rows, n_jobs, chunk_size):
+    if chunk_size is None:
+        # a few chunks per worker evens out chunks that score slower than others
+        chunk_size = max(10_000, -(-n_rows // (4 * n_jobs)))
+    return [(start, min(start + chunk_size, n_rows)) for start in range(0, n_rows, chunk_size)]
+
+
+def parallel_decision_function(model, X, n_jobs=None, chunk_size=None, method='decision_function',
+                               min_rows=MIN_PARALLEL_ROWS):
+    """
+    model.decision_function(X) computed by `n_jobs` processes (default: all cores) over row chunks of X.
+
+    `method` can name any row-wise scoring method of the model (e.g. 'score_samples'). Inputs smaller than
+    `min_rows` are scored in-process.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or len(X) < min_rows:
+        return np.asarray(getattr(model, method)(X), dtype=np.float64)
+
+    columns = list(X.columns) if isinstance(X, pd.DataFrame) else None
+    values = np.ascontiguousarray(X)
+    bounds = _chunk_bounds(len(values), n_jobs, chunk_size)
+    with SharedArray.from_array(values) as shared_in, SharedArray.empty((len(values),)) as shared_out:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(bounds)), initializer=_init_worker,
+                                 initargs=(model, shared_in.spec, shared_out.spec, columns, method)) as pool:
+            for future in [pool.submit(_score_chunk, start, stop) for start, stop in bounds]:
+                future.result()
+        return shared_out.array.copy()
+
+
+def parallel_predict(model, X, n_jobs=None, chunk_size=None, contamination=None):
+    """Labels in the model's own convention, derived from parallel_decision_function() scores."""
+    return labels_from_scores(model, parallel_decision_function(model, X, n_jobs, chunk_size), contamination)
+
+
+def parallel_outlier_mask(model, X, n_jobs=None, chunk_size=None, contamination=None):
+    labels = parallel_predict(model, X, n_jobs, chunk_size, contamination)
+    return labels == (1 if higher_is_anomalous(model) else -1)
@@ -0,0 +1,115 @@
+"""
+Streaming approximate quantiles with a KLL sketch.
+
+The contamination cutoff was computed with np.percentile(scores, 100 * contamination), which needs every score in
+memory. KLLSketch consumes scores chunk by chunk, keeps O(k log(n / k)) of them, answers any quantile with a rank
+error of roughly 1.7 / k, and sketches built by different workers can be merged, so the 1% cutoff of billions of
+scores can be computed without ever materializing them.
+
+Reference: Karnin, Lang, Liberty - "Optimal Quantile Approximation in Streams" (2016).
+"""
+
+import numpy as np
+
+
+class KLLSketch:
+
+    def __init__(self, k=2000, random_state=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self._rng = np.random.default_rng(random_state)
+
+    def _capacity(self, level):
+        # the top level holds k items, lower levels shrink geometrically by 2/3
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def update(self, values):
+        """Add a chunk of values (NaNs are ignored)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.count += values.size
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item stays behind; of the rest every other one (random start) is promoted with double weight
+                keep = items[:len(items) % 2]
+                pairs = items[len(items) % 2:]
+                promoted = pairs[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                # capacities depend on the number of levels, so re-check from the bottom
+                level = 0
+                continue
+            level += 1
+
+    def merge(self, other):
+        """Fold another sketch into this one (e.g. from a worker process)."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def _weighted_items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Approximate q-quantile (q in [0, 1], scalar or array)."""
+        if self.count == 0:
+            raise ValueError('quantile of an empty sketch')
+        items, cumulative = self._weighted_items()
+        ranks = np.asarray(q, dtype=np.float64) * cumulative[-1]
+        positions = np.minimum(np.searchsorted(cumulative, ranks, side='left'), len(items) - 1)
+        return items[positions]
+
+    def percentile(self, p):
+        """Same as quantile() with p in [0, 100], mirroring np.percentile."""
+        return self.quantile(np.asarray(p, dtype=np.float64) / 100.0)
+
+    def rank(self, value):
+        """Approximate fraction of values <= value."""
+        items, cumulative = self._weighted_items()
+        position = np.searchsorted(items, value, side='right')
+        return cumulative[position - 1] / cumulative[-1] if position else 0.0
+
+    @property
+    def size(self):
+        return sum(len(level) for level in self.levels)
+
+
+def merge_sketches(sketches):
+    total = KLLSketch(k=sketches[0].k)
+    for sketch in sketches:
+        total.merge(sketch)
+    return total
+
+
+def contamination_threshold(score_chunks, contamination, higher_is_anomalous=True, k=2000):
+    """
+    Cutoff flagging the `contamination` fraction of scores, computed from an iterable of score chunks.
+
+    For pyod-style scores (higher is more anomalous) this is the (1 - contamination) quantile, for sklearn-style
+    scores the contamination quantile.
+    """
+    sketch = KLLSketch(k=k)
+    for chunk in score_chunks:
+        sketch.update(chunk)
+    return float(sketch.quantile(1 - contamination if higher_is_anomalous else contamination))
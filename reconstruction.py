@@ -0,0 +1,96 @@
+"""
+Closed-form reconstruction-error detector.
+
+The pyod AutoEncoder in section 4.3 trains for 100 epochs at batch size 32 to learn a reconstruction of two features.
+A linear autoencoder with squared loss is solved exactly by PCA, so ReconstructionDetector fits the principal
+components from the feature covariance in one pass over the data (accumulated chunk by chunk with partial_fit, so the
+moments can also be built out of core) and scores rows by their squared reconstruction error. Optionally the features
+are first lifted with random Fourier features (an approximation of an RBF kernel) to capture non-linear structure,
+still without any iterative training.
+
+The detector follows the same pyod contract as the models in section 4: decision_function() is higher for outliers,
+predict() returns 1 for outliers / 0 for inliers, and threshold_ / decision_scores_ are set by fit().
+"""
+
+import numpy as np
+
+
+class ReconstructionDetector:
+
+    # pyod convention, see score_cache.higher_is_anomalous
+    outlier_scores_high = True
+
+    def __init__(self, n_components=1, contamination=0.1, standardize=True, kernel=None, n_kernel_features=100,
+                 gamma=1.0, chunk_size=100_000, random_state=None):
+        if kernel not in (None, 'rbf'):
+            raise ValueError("kernel must be None or 'rbf'")
+        self.n_components = n_components
+        self.contamination = contamination
+        self.standardize = standardize
+        self.kernel = kernel
+        self.n_kernel_features = n_kernel_features
+        self.gamma = gamma
+        self.chunk_size = chunk_size
+        self.random_state = random_state
+
+    def get_params(self, deep=True):
+        return {name: getattr(self, name) for name in (
+            'n_components', 'contamination', 'standardize', 'kernel', 'n_kernel_features', 'gamma', 'chunk_size',
+            'random_state')}
+
+    def _lift(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.kernel is None:
+            return X
+        if not hasattr(self, 'kernel_weights_'):
+            rng = np.random.default_rng(self.random_state)
+            self.kernel_weights_ = rng.normal(scale=np.sqrt(2 * self.gamma), size=(X.shape[1], self.n_kernel_features))
+            self.kernel_offsets_ = rng.uniform(0, 2 * np.pi, self.n_kernel_features)
+        return np.sqrt(2.0 / self.n_kernel_features) * np.cos(X @ self.kernel_weights_ + self.kernel_offsets_)
+
+    def partial_fit(self, chunk):
+        """Add one chunk to the accumulated count, sum and cross-product and refresh the components."""
+        Z = self._lift(chunk)
+        if not hasattr(self, 'n_samples_'):
+            self.n_samples_ = 0
+            self._sum = np.zeros(Z.shape[1])
+            self._cross = np.zeros((Z.shape[1], Z.shape[1]))
+        self.n_samples_ += len(Z)
+        self._sum += Z.sum(axis=0)
+        self._cross += Z.T @ Z
+        self._solve()
+        return self
+
+    def _solve(self):
+        # principal components of the accumulated covariance, solved in closed form (a d x d eigenproblem)
+        self.mean_ = self._sum / self.n_samples_
+        covariance = self._cross / self.n_samples_ - np.outer(self.mean_, self.mean_)
+        if self.standardize:
+            self.scale_ = np.sqrt(np.clip(np.diag(covariance), 1e-12, None))
+        else:
+            self.scale_ = np.ones(len(self.mean_))
+        covariance = covariance / np.outer(self.scale_, self.scale_)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:self.n_components]
+        self.explained_variance_ = eigenvalues[order]
+        self.components_ = eigenvectors[:, order].T
+
+    def fit(self, X, y=None):
+        X = X.to_numpy() if hasattr(X, 'to_numpy') else np.asarray(X)
+        for name in ('n_samples_', 'kernel_weights_', 'kernel_offsets_'):
+            self.__dict__.pop(name, None)
+        for start in range(0, len(X), self.chunk_size):
+            self.partial_fit(X[start:start + self.chunk_size])
+        self.decision_scores_ = self.decision_function(X)
+        self.threshold_ = np.percentile(self.decision_scores_, 100 * (1 - self.contamination))
+        self.labels_ = (self.decision_scores_ > self.threshold_).astype(int)
+        return self
+
+    def decision_function(self, X):
+        """Squared reconstruction error of every row."""
+        Z = (self._lift(X) - self.mean_) / self.scale_
+        reconstruction = (Z @ self.components_.T) @ self.components_
+        return ((Z - reconstruction) ** 2).sum(axis=1)
+
+    def predict(self, X):
+        return (self.decision_function(X) > self.threshold_).astype(int)
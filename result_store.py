@@ -0,0 +1,191 @@
+"""
+Indexed outlier result store.
+
+Outlier frames used to be printed and thrown away, so drilling down by order, customer or product meant rerunning
+the whole script. ResultStore keeps every scoring run in one SQLite file: a `runs` table (run ID, detector, model
+version, parameters, counts) and a `results` table with one row per scored transaction - its identifying columns,
+the measures, the score (oriented so that higher is more anomalous, whatever the detector's convention) and the
+outlier flag. Indexes on Order ID, Customer and Product (across runs) and on Order Date, Category / Sub-Category and
+score (within a run) turn drill-down questions into index lookups, and a new run is appended in one transaction
+without rewriting earlier ones:
+
+    store = ResultStore()
+    store.append_model_run(sales_ifmodel, df[['Sales']], df, 'sales_iforest')
+    store.top(10, by='Profit', sub_category='Machines', start='2017-10-01', end='2017-12-31')   # top losses
+    store.lookup(order_id='CA-2017-152156')
+"""
+
+import json
+import os
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outlier_results.sqlite')
+
+# transaction columns copied into the store: (DataFrame column, store column)
+STORE_COLUMNS = [('Row ID', 'row_id'), ('Order ID', 'order_id'), ('Order Date', 'order_date'),
+                 ('Customer ID', 'customer_id'), ('Customer Name', 'customer_name'), ('Region', 'region'),
+                 ('City', 'city'), ('Category', 'category'), ('Sub-Category', 'sub_category'),
+                 ('Product ID', 'product_id'), ('Product Name', 'product_name'), ('Sales', 'sales'),
+                 ('Quantity', 'quantity'), ('Discount', 'discount'), ('Profit', 'profit')]
+_SORTABLE = {'score': 'score', 'Sales': 'sales', 'Profit': 'profit', 'Discount': 'discount',
+             'Quantity': 'quantity', 'Order Date': 'order_date'}
+# dates are stored as sortable ISO text
+_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    detector TEXT NOT NULL,
+    model_version TEXT,
+    created_at TEXT NOT NULL,
+    params TEXT,
+    n_rows INTEGER,
+    n_outliers INTEGER
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    row_id INTEGER, order_id TEXT, order_date TEXT, customer_id TEXT, customer_name TEXT, region TEXT, city TEXT,
+    category TEXT, sub_category TEXT, product_id TEXT, product_name TEXT,
+    sales REAL, quantity INTEGER, discount REAL, profit REAL,
+    score REAL, outlier INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_order_id ON results (order_id);
+CREATE INDEX IF NOT EXISTS results_customer ON results (customer_id);
+CREATE INDEX IF NOT EXISTS results_product ON results (product_name);
+CREATE INDEX IF NOT EXISTS results_order_date ON results (run_id, order_date);
+CREATE INDEX IF NOT EXISTS results_category ON results (run_id, category, order_date);
+CREATE INDEX IF NOT EXISTS results_sub_category ON results (run_id, sub_category, order_date);
+CREATE INDEX IF NOT EXISTS results_score ON results (run_id, outlier, score);
+"""
+
+
+def _date_text(value):
+    return None if value is None else pd.Timestamp(value).strftime(_DATE_FORMAT)
+
+
+class ResultStore:
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # readers are not blocked while a run is being appended; with WAL, NORMAL sync is still crash safe
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+
+    def append_run(self, df, scores, outliers, detector, model_version=None, run_id=None, params=None,
+                   outliers_only=False):
+        """
+        Append one scoring run and return its run ID.
+
+        `scores` (higher = more anomalous) and `outliers` are aligned with the rows of `df`; columns of STORE_COLUMNS
+        missing from `df` are stored as NULL. With `outliers_only` only the flagged rows are written.
+        """
+        run_id = run_id or uuid.uuid4().hex
+        outliers = np.asarray(outliers, dtype=bool)
+        rows = df if not outliers_only else df[outliers]
+        columns = {}
+        for source, target in STORE_COLUMNS:
+            if source not in rows.columns:
+                columns[target] = [None] * len(rows)
+            elif target == 'order_date':
+                columns[target] = rows[source].dt.strftime(_DATE_FORMAT).tolist()
+            else:
+                # tolist() yields Python scalars, which sqlite3 binds without adapters
+                columns[target] = rows[source].tolist()
+        columns['score'] = np.asarray(scores, dtype=np.float64)[outliers if outliers_only else slice(None)].tolist()
+        columns['outlier'] = outliers[outliers if outliers_only else slice(None)].astype(int).tolist()
+
+        names = list(columns)
+        with self.conn:
+            self.conn.execute('INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (run_id, detector, model_version, datetime.now(timezone.utc).isoformat(),
+                               json.dumps(params or {}, default=str), len(df), int(outliers.sum())))
+            self.conn.executemany('INSERT INTO results (run_id, {}) VALUES (?, {})'.format(
+                ', '.join(names), ', '.join('?' * len(names))), zip([run_id] * len(rows), *columns.values()))
+        return run_id
+
+    def append_model_run(self, model, X, df, detector, run_id=None, outliers_only=False):
+        """Score X with a fitted model (scores cached, see score_cache) and append the run, versioned by model_key."""
+        from model_registry import model_key
+        from score_cache import cached_decision_function, default_cache, higher_is_anomalous
+
+        scores = np.asarray(cached_decision_function(model, X), dtype=np.float64)
+        outliers = default_cache.outlier_mask(model, X)
+        params = model.get_params(deep=False) if hasattr(model, 'get_params') else None
+        return self.append_run(df, scores if higher_is_anomalous(model) else -scores, outliers, detector,
+                               model_version=model_key(model, X), run_id=run_id, params=params,
+                               outliers_only=outliers_only)
+
+    def query(self, sql, params=()):
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def runs(self, detector=None):
+        if detector is None:
+            return self.query('SELECT * FROM runs ORDER BY created_at')
+        return self.query('SELECT * FROM runs WHERE detector = ? ORDER BY created_at', (detector,))
+
+    def latest_run(self, detector=None):
+        sql = 'SELECT run_id FROM runs {} ORDER BY created_at DESC LIMIT 1'.format(
+            'WHERE detector = ?' if detector is not None else '')
+        row = self.conn.execute(sql, (detector,) if detector is not None else ()).fetchone()
+        return row[0] if row else None
+
+    def top(self, k=10, by='score', ascending=None, run_id=None, detector=None, category=None, sub_category=None,
+            start=None, end=None, outliers_only=True):
+        """
+        Top `k` stored rows by `by` ('score', 'Sales', 'Profit', ...), filtered by category and order date range.
+
+        Without `run_id` the latest run (of `detector`, if given) is used. `ascending` defaults to True for Profit
+        (largest losses first) and False otherwise. `end` is inclusive of that whole day.
+        """
+        if by not in _SORTABLE:
+            raise ValueError('by must be one of {}'.format(sorted(_SORTABLE)))
+        if ascending is None:
+            ascending = by == 'Profit'
+        run_id = run_id or self.latest_run(detector)
+        where, params = ['run_id = ?'], [run_id]
+        if outliers_only:
+            where.append('outlier = 1')
+        if category is not None:
+            where.append('category = ?')
+            params.append(category)
+        if sub_category is not None:
+            where.append('sub_category = ?')
+            params.append(sub_category)
+        if start is not None:
+            where.append('order_date >= ?')
+            params.append(_date_text(start))
+        if end is not None:
+            where.append('order_date < ?')
+            params.append(_date_text(pd.Timestamp(end).normalize() + pd.Timedelta(days=1)))
+        sql = 'SELECT * FROM results WHERE {} ORDER BY {} {} LIMIT ?'.format(
+            ' AND '.join(where), _SORTABLE[by], 'ASC' if ascending else 'DESC')
+        return self.query(sql, params + [k])
+
+    def lookup(self, order_id=None, customer_id=None, product_name=None, run_id=None):
+        """Every stored result (all runs unless `run_id` is given) for an order, customer or product."""
+        where, params = [], []
+        for column, value in (('order_id', order_id), ('customer_id', customer_id), ('product_name', product_name),
+                              ('run_id', run_id)):
+            if value is not None:
+                where.append('results.{} = ?'.format(column))
+                params.append(value)
+        if not where:
+            raise ValueError('lookup needs an order_id, customer_id or product_name')
+        return self.query('SELECT runs.detector, runs.model_version, results.* FROM results '
+                          'JOIN runs USING (run_id) WHERE {} ORDER BY score DESC'.format(' AND '.join(where)), params)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,78 @@
+"""
+Score cache shared by decision_function() and predict().
+
+visualize_anomalies and the filtering cells used to call decision_function() and then predict() on the same data,
+and predict() itself scores the data again internally - several full passes over every tree (or a forward pass of the
+autoencoder) per model. Here raw scores are computed once per (model, dataset) pair and labels, threshold changes and
+top-k queries are all derived from the cached array.
+"""
+
+import weakref
+
+import numpy as np
+
+from model_registry import data_fingerprint
+
+
+def higher_is_anomalous(model):
+    # pyod detectors score outliers high, sklearn-style ones (IsolationForest, UnivariateIsolationForest) score them low;
+    # detectors of our own that follow the pyod convention say so with an `outlier_scores_high` attribute
+    return getattr(model, 'outlier_scores_high', type(model).__module__.startswith('pyod'))
+
+
+def labels_from_scores(model, scores, contamination=None):
+    """
+    Labels in the model's own convention (pyod: 1 = outlier / 0 = inlier, sklearn: -1 = outlier / 1 = inlier).
+
+    Without `contamination` the model's fitted threshold is used, which reproduces model.predict(); otherwise the
+    cutoff is the matching percentile of the given scores.
+    """
+    scores = np.asarray(scores)
+    if higher_is_anomalous(model):
+        if contamination is None:
+            threshold = model.threshold_
+        else:
+            threshold = np.percentile(scores, 100 * (1 - contamination))
+        return (scores > threshold).astype(int)
+    # sklearn's decision_function is already shifted so that 0 is the fitted cutoff
+    threshold = 0 if contamination is None else np.percentile(scores, 100 * contamination)
+    return np.where(scores < threshold, -1, 1)
+
+
+class ScoreCache:
+    """Raw decision scores per (model, dataset), computed on first use."""
+
+    def __init__(self):
+        # models are weakly referenced so that cached scores go away with the model
+        self._scores = weakref.WeakKeyDictionary()
+
+    def decision_function(self, model, X):
+        per_model = self._scores.setdefault(model, {})
+        key = data_fingerprint(X)
+        if key not in per_model:
+            per_model[key] = np.asarray(model.decision_function(X))
+        return per_model[key]
+
+    def predict(self, model, X, contamination=None):
+        return labels_from_scores(model, self.decision_function(model, X), contamination)
+
+    def outlier_mask(self, model, X, contamination=None):
+        labels = self.predict(model, X, contamination)
+        return labels == (1 if higher_is_anomalous(model) else -1)
+
+    def invalidate(self, model=None):
+        if model is None:
+            self._scores = weakref.WeakKeyDictionary()
+        else:
+            self._scores.pop(model, None)
+
+
+default_cache = ScoreCache()
+
+
+def cached_decision_function(model, X):
+    return default_cache.decision_function(model, X)
+
+
+def cached_predict(model, X, contamination=None):
+    return default_cache.predict(model, X, contamination)
@@ -0,0 +1,336 @@
+"""
+Local micro-batching scoring service.
+
+Loads the fitted detectors (and the MinMaxScaler for the multivariate ones) once and screens transactions as they
+arrive over HTTP on localhost or a Unix socket. Concurrent requests are queued and grouped into micro-batches, so the
+models see one vectorized decision_function() call per batch instead of one per transaction. A batch is scored as
+soon as it holds `max_batch_size` transactions or `max_wait_ms` after its first transaction arrived, which bounds
+the latency added by batching.
+
+    python scoring_service.py --build-bundle service_bundle.joblib
+    python scoring_service.py --bundle service_bundle.joblib --port 8765 --max-batch-size 256 --max-wait-ms 5
+
+    POST /score  {"Sales": 1234.5, "Discount": 0.2, "Profit": -50.0}   (or a list of such objects)
+    GET  /health
+
+Everything is standard library asyncio; score_transactions() is a matching client for scripts and offline tests.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+
+import joblib
+import numpy as np
+
+from score_cache import higher_is_anomalous, labels_from_scores
+
+
+class InvalidTransaction(ValueError):
+    """A transaction that lacks a field the models read or has a non-numeric value."""
+
+
+class BadRequest(ValueError):
+    """An HTTP request that cannot be parsed."""
+
+
+class ModelSpec:
+    """A fitted detector with the transaction fields it reads and an optional fitted scaler."""
+
+    def __init__(self, name, model, columns, scaler=None):
+        self.name = name
+        self.model = model
+        self.columns = list(columns)
+        self.scaler = scaler
+
+    def score(self, transactions):
+        X = np.array([[transaction[column] for column in self.columns] for transaction in transactions],
+                     dtype=np.float64)
+        if self.scaler is not None:
+            X = self.scaler.transform(X)
+        scores = np.asarray(self.model.decision_function(X), dtype=np.float64)
+        outliers = labels_from_scores(self.model, scores) == (1 if higher_is_anomalous(self.model) else -1)
+        return scores, outliers
+
+
+def save_bundle(specs, path):
+    joblib.dump(specs, path)
+
+
+def load_bundle(path):
+    return joblib.load(path)
+
+
+def build_default_bundle(path, source=None, contamination=0.01):
+    """Fit (or load from the model registry) the notebook's Sales Isolation Forest and Discount/Profit CBLOF."""
+    import pandas as pd
+    from pyod.models import cblof
+    from sklearn.ensemble import IsolationForest
+    from sklearn.preprocessing import MinMaxScaler
+
+    from model_registry import get_or_fit
+    from superstore_cache import DEFAULT_DATASET, load_superstore
+
+    df = load_superstore(source or DEFAULT_DATASET, columns=['Sales', 'Discount', 'Profit'])
+    sales_ifmodel = get_or_fit(IsolationForest(n_estimators=100, contamination=contamination),
+                               df[['Sales']].to_numpy())
+    cols = ['Discount', 'Profit']
+    mms = MinMaxScaler(feature_range=(0, 1)).fit(df[cols].to_numpy())
+    subset = pd.DataFrame(mms.transform(df[cols].to_numpy()), columns=cols).to_numpy()
+    cblof_model = get_or_fit(cblof.CBLOF(contamination=contamination, random_state=42), subset)
+    specs = [ModelSpec('sales_iforest', sales_ifmodel, ['Sales']),
+             ModelSpec('cblof', cblof_model, cols, scaler=mms)]
+    save_bundle(specs, path)
+    return specs
+
+
+class MicroBatcher:
+    """Collects transactions from concurrent callers and scores them in batches."""
+
+    def __init__(self, specs, max_batch_size=256, max_wait_ms=5.0):
+        self.specs = specs
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue()
+        self.batches_scored = 0
+        self.columns = list(dict.fromkeys(column for spec in specs for column in spec.columns))
+        self._worker = None
+
+    def start(self):
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    def parse(self, transaction):
+        """The fields the models read, as floats; raises InvalidTransaction so that only its sender gets the error."""
+        if not isinstance(transaction, dict):
+            raise InvalidTransaction('a transaction must be a JSON object, got {!r}'.format(transaction))
+        missing = [column for column in self.columns if column not in transaction]
+        if missing:
+            raise InvalidTransaction('missing field(s) {}'.format(', '.join(missing)))
+        try:
+            parsed = {column: float(transaction[column]) for column in self.columns}
+        except (TypeError, ValueError) as exc:
+            raise InvalidTransaction('non-numeric field: {}'.format(exc)) from None
+        # float() also accepts NaN / Infinity (JSON literals or strings like "inf"), which the models reject batch-wide
+        non_finite = [column for column, value in parsed.items() if not math.isfinite(value)]
+        if non_finite:
+            raise InvalidTransaction('non-finite field(s) {}'.format(', '.join(non_finite)))
+        return parsed
+
+    async def score(self, transaction):
+        # validated before queueing: a bad transaction must not fail the batch it would have been scored in
+        parsed = self.parse(transaction)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((parsed, future))
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _score_batch(self, transactions):
+        results = [{'scores': {}, 'outlier': {}} for _ in transactions]
+        for spec in self.specs:
+            scores, outliers = spec.score(transactions)
+            for result, score, outlier in zip(results, scores, outliers):
+                result['scores'][spec.name] = float(score)
+                result['outlier'][spec.name] = bool(outlier)
+        for result in results:
+            result['any_outlier'] = any(result['outlier'].values())
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            transactions = [transaction for transaction, _ in batch]
+            try:
+                # model code is CPU bound, keep the event loop free to accept the next batch meanwhile
+                results = await loop.run_in_executor(None, self._score_batch, transactions)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.batches_scored += 1
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+async def _read_request(reader):
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    if not request_line:
+        return None
+    parts = request_line.split(' ')
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise BadRequest('malformed request line {!r}'.format(request_line))
+    method, path, _ = parts
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise BadRequest('invalid Content-Length {!r}'.format(headers['content-length'])) from None
+    if length < 0:
+        raise BadRequest('invalid Content-Length {}'.format(length))
+    body = await reader.readexactly(length)
+    return method, path, headers, body
+
+
+def _response(status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}[status]
+    head = ('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'
+            .format(status, reason, len(body), 'keep-alive' if keep_alive else 'close'))
+    return head.encode() + body
+
+
+class ScoringServer:
+
+    def __init__(self, specs, max_batch_size=256, max_wait_ms=5.0, backlog=1024):
+        self.batcher = MicroBatcher(specs, max_batch_size, max_wait_ms)
+        self.backlog = backlog
+        self.server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except BadRequest as exc:
+                    # the stream position is unknown after a bad request, so answer and close the connection
+                    writer.write(_response(400, {'error': str(exc)}, keep_alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status, payload = await self._dispatch(method, path, body)
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok', 'models': [spec.name for spec in self.batcher.specs],
+                         'batches_scored': self.batcher.batches_scored}
+        if method != 'POST' or path != '/score':
+            return 404, {'error': 'unknown endpoint {} {}'.format(method, path)}
+        try:
+            payload = json.loads(body)
+        except ValueError as exc:
+            return 400, {'error': 'invalid JSON: {}'.format(exc)}
+        transactions = payload if isinstance(payload, list) else [payload]
+        try:
+            for transaction in transactions:
+                self.batcher.parse(transaction)
+        except InvalidTransaction as exc:
+            return 400, {'error': 'invalid transaction: {}'.format(exc)}
+        try:
+            results = await asyncio.gather(*(self.batcher.score(transaction) for transaction in transactions))
+        except Exception as exc:
+            return 500, {'error': 'scoring failed: {!r}'.format(exc)}
+        return 200, results if isinstance(payload, list) else results[0]
+
+    async def start(self, host='127.0.0.1', port=8765, unix_path=None):
+        self.batcher.start()
+        # a deep accept backlog: bursts of concurrent clients are the point of micro-batching
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self._handle, path=unix_path, backlog=self.backlog)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port, backlog=self.backlog)
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+
+
+async def score_transactions(transactions, host='127.0.0.1', port=8765, unix_path=None):
+    """Minimal client: POST the transactions (a dict or a list of dicts) and return the decoded response."""
+    if unix_path:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(transactions).encode()
+    writer.write('POST /score HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 'Content-Length: {}\r\nConnection: close\r\n\r\n'.format(len(body)).encode() + body)
+    await writer.drain()
+    status_line = (await reader.readline()).decode()
+    while (await reader.readline()).strip():
+        pass
+    response = json.loads(await reader.read())
+    writer.close()
+    if ' 200 ' not in status_line:
+        raise RuntimeError('{}: {}'.format(status_line.strip(), response))
+    return response
+
+
+async def _serve_forever(args):
+    server = ScoringServer(load_bundle(args.bundle), args.max_batch_size, args.max_wait_ms)
+    await server.start(args.host, args.port, args.unix)
+    print('Scoring service listening on', args.unix or '{}:{}'.format(args.host, args.port))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-batching anomaly scoring service.')
+    parser.add_argument('--bundle', default='service_bundle.joblib')
+    parser.add_argument('--build-bundle', metavar='PATH', help='fit the default models, save them and exit')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args(argv)
+    if args.build_bundle:
+        # go through the importable module so the bundle pickles scoring_service.ModelSpec, not __main__.ModelSpec,
+        # and can be loaded by other programs
+        import scoring_service
+        scoring_service.build_default_bundle(args.build_bundle)
+        print('Bundle written to', args.build_bundle)
+        return 0
+    try:
+        asyncio.run(_serve_forever(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
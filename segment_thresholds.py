@@ -0,0 +1,67 @@
+"""
+Per-segment three-sigma thresholds.
+
+The global mean + 3 sigma rule treats a $5k Copier and a $5k Binder the same. Here the limits are computed for
+every segment (e.g. Category x Sub-Category, or City x Sub-Category) in a single groupby pass and rows are flagged
+by broadcasting the limits back onto the frame, with no Python loop over groups. The threshold table can be saved
+and reused to score new transactions.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def segment_thresholds(df, column, by, n_sigma=3, min_count=2):
+    """
+    Return a table indexed by the segment keys with count, mean, std, lower and upper limits for `column`.
+
+    Segments with fewer than `min_count` rows get NaN limits (and are never flagged).
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    table = df.groupby(by, observed=True, sort=False)[column].agg(['count', 'mean', 'std'])
+    table.loc[table['count'] < min_count, 'std'] = np.nan
+    table['lower'] = table['mean'] - n_sigma * table['std']
+    table['upper'] = table['mean'] + n_sigma * table['std']
+    return table
+
+
+def _limits_for_rows(df, table):
+    # align the per-segment limits with every row of df in one vectorized lookup
+    keys = list(table.index.names)
+    if len(keys) == 1:
+        row_keys = pd.Index(df[keys[0]])
+    else:
+        row_keys = pd.MultiIndex.from_frame(df[keys])
+    positions = table.index.get_indexer(row_keys)
+    lower = table['lower'].to_numpy()[positions]
+    upper = table['upper'].to_numpy()[positions]
+    # segments not seen when the table was built have no limits
+    unseen = positions == -1
+    lower[unseen] = np.nan
+    upper[unseen] = np.nan
+    return lower, upper
+
+
+def flag_segment_outliers(df, column, by=None, table=None, n_sigma=3):
+    """
+    Boolean mask of rows outside their segment's limits.
+
+    Pass a previously computed `table` to score new data against cached thresholds, otherwise it is computed
+    from `df` using the `by` keys.
+    """
+    if table is None:
+        table = segment_thresholds(df, column, by, n_sigma=n_sigma)
+    lower, upper = _limits_for_rows(df, table)
+    values = df[column].to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        mask = (values > upper) | (values < lower)
+    return pd.Series(mask, index=df.index, name=column + ' Outlier')
+
+
+def save_thresholds(table, path):
+    table.reset_index().to_parquet(path, index=False)
+
+
+def load_thresholds(path, by):
+    by = [by] if isinstance(by, str) else list(by)
+    return pd.read_parquet(path).set_index(by)
@@ -0,0 +1,57 @@
+"""
+Helpers to hand numpy arrays to worker processes through multiprocessing.shared_memory instead of pickling them.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArray:
+    """
+    A numpy array backed by a named shared memory block.
+
+    The parent creates it with SharedArray.from_array() / SharedArray.empty() and passes `spec` to workers, which
+    call SharedArray.attach(spec) to get a view on the same memory. Only the creator should call unlink().
+    """
+
+    def __init__(self, shm, shape, dtype):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+    @classmethod
+    def empty(cls, shape, dtype=np.float64):
+        nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        return cls(shared_memory.SharedMemory(create=True, size=nbytes), shape, dtype)
+
+    @classmethod
+    def from_array(cls, values):
+        values = np.asarray(values)
+        shared = cls.empty(values.shape, values.dtype)
+        shared.array[...] = values
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype)
+
+    @property
+    def spec(self):
+        return self.shm.name, self.shape, self.dtype.str
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
@@ -0,0 +1,127 @@
+"""
+Streaming three-sigma detector.
+
+The statistical section of the notebook computes df['Sales'].mean() and .std() on the full table. Here the same
+thresholds are computed from chunks of transactions with Welford's online algorithm, and partial statistics from
+different chunks (or worker processes) are combined with Chan's parallel merge, so the history never has to be in
+memory at once. A second pass over the chunks then picks out the outlier rows.
+"""
+
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from topk import StreamingTopK
+
+
+class RunningStats:
+    """Mergeable count / mean / sum of squared deviations for one column."""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, values):
+        # fold a whole chunk in at once: compute its own moments, then merge them
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        chunk_mean = values.mean()
+        chunk = RunningStats(values.size, chunk_mean, float(((values - chunk_mean) ** 2).sum()))
+        return self.merge(chunk)
+
+    def merge(self, other):
+        # Chan et al. pairwise update, numerically stable for large counts
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        return self
+
+    @property
+    def variance(self):
+        # sample variance (ddof=1) to match pandas' Series.std()
+        return self.m2 / (self.count - 1) if self.count > 1 else float('nan')
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+    def thresholds(self, n_sigma=3):
+        """Return the (lower, upper) mean -/+ n_sigma * std limits."""
+        return self.mean - n_sigma * self.std, self.mean + n_sigma * self.std
+
+    def __repr__(self):
+        return 'RunningStats(count={}, mean={}, std={})'.format(self.count, self.mean, self.std)
+
+
+def iter_chunks(path, columns=None, chunksize=100_000):
+    """Yield DataFrame chunks from a .csv or .parquet file without loading it fully."""
+    if str(path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def column_stats(chunks, column):
+    stats = RunningStats()
+    for chunk in chunks:
+        stats.update(chunk[column].values)
+    return stats
+
+
+def _partition_stats(args):
+    path, column, chunksize = args
+    return column_stats(iter_chunks(path, [column], chunksize), column)
+
+
+def parallel_column_stats(paths, column, chunksize=100_000, processes=None):
+    """Reduce the statistics of several partition files in a process pool."""
+    with Pool(processes) as pool:
+        partials = pool.map(_partition_stats, [(path, column, chunksize) for path in paths])
+    total = RunningStats()
+    for stats in partials:
+        total.merge(stats)
+    return total
+
+
+def stream_outliers(chunks, column, lower, upper, top_k=None):
+    """
+    Second pass: return the rows whose `column` falls outside [lower, upper].
+
+    With top_k set, only the k most extreme rows on each side are buffered (bounded memory), otherwise every
+    outlier row is kept.
+    """
+    if top_k is None:
+        flagged = [chunk[(chunk[column] > upper) | (chunk[column] < lower)] for chunk in chunks]
+        flagged = [part for part in flagged if len(part)]
+        return pd.concat(flagged) if flagged else pd.DataFrame()
+
+    high, low = StreamingTopK(top_k), StreamingTopK(top_k)
+    for chunk in chunks:
+        values = chunk[column].to_numpy()
+        above, below = values > upper, values < lower
+        if above.any():
+            high.push_chunk(values[above], chunk[above])
+        if below.any():
+            low.push_chunk(-values[below], chunk[below])
+    return pd.DataFrame(high.items() + low.items())
+
+
+def streaming_three_sigma(path, column, chunksize=100_000, n_sigma=3, top_k=None):
+    """Two passes over `path`: thresholds first, then the outlier rows."""
+    stats = column_stats(iter_chunks(path, [column], chunksize), column)
+    lower, upper = stats.thresholds(n_sigma)
+    outliers = stream_outliers(iter_chunks(path, None, chunksize), column, lower, upper, top_k=top_k)
+    return stats, (lower, upper), outliers
@@ -0,0 +1,100 @@
+"""
+Columnar cache for the Superstore workbook.
+
+Parsing the .xls with pd.read_excel is by far the slowest part of a run, so we convert the workbook once into a
+Parquet file next to it and read only the columns a detector asks for on later runs. The cache is rebuilt whenever
+the source workbook changes (size/mtime first, content hash to confirm).
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Sample - Superstore.xls')
+CACHE_VERSION = 1
+
+
+def _cache_paths(source_path, cache_dir=None):
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(source_path)), '.superstore_cache')
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return (os.path.join(cache_dir, stem + '.parquet'),
+            os.path.join(cache_dir, stem + '.meta.json'))
+
+
+def file_digest(path, chunk_size=1 << 20):
+    # content hash of the source file, read in chunks so large exports don't need to fit in memory
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def is_cache_fresh(source_path=DEFAULT_DATASET, cache_dir=None):
+    data_path, meta_path = _cache_paths(source_path, cache_dir)
+    meta = _read_meta(meta_path)
+    if meta is None or meta.get('version') != CACHE_VERSION or not os.path.exists(data_path):
+        return False
+    stamp = _source_stamp(source_path)
+    if stamp == meta.get('stamp'):
+        return True
+    # mtime changed (e.g. the file was copied) - only rebuild if the content really differs
+    if stamp['size'] == meta['stamp']['size'] and file_digest(source_path) == meta.get('sha1'):
+        meta['stamp'] = stamp
+        with open(meta_path, 'w') as fh:
+            json.dump(meta, fh)
+        return True
+    return False
+
+
+def build_cache(source_path=DEFAULT_DATASET, cache_dir=None):
+    # parse the workbook once and store it column-wise
+    data_path, meta_path = _cache_paths(source_path, cache_dir)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    df = pd.read_excel(source_path)
+    tmp_path = data_path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, data_path)
+    meta = {'version': CACHE_VERSION,
+            'source': os.path.abspath(source_path),
+            'stamp': _source_stamp(source_path),
+            'sha1': file_digest(source_path),
+            'columns': list(df.columns),
+            'rows': len(df)}
+    with open(meta_path, 'w') as fh:
+        json.dump(meta, fh)
+    return data_path
+
+
+def load_superstore(source_path=DEFAULT_DATASET, columns=None, cache_dir=None, use_cache=True, compact=False):
+    """
+    Load the Superstore dataset, optionally restricted to `columns`, through the Parquet cache.
+
+    With compact=True text columns are loaded as categoricals and numerics as 32-bit (see compact.compact_frame).
+    """
+    if not use_cache:
+        df = pd.read_excel(source_path, usecols=columns)
+    else:
+        data_path, _ = _cache_paths(source_path, cache_dir)
+        if not is_cache_fresh(source_path, cache_dir):
+            build_cache(source_path, cache_dir)
+        df = pd.read_parquet(data_path, columns=list(columns) if columns is not None else None)
+    if compact:
+        from compact import compact_frame
+        df = compact_frame(df)
+    return df
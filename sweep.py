@@ -0,0 +1,116 @@
+"""
+Contamination and hyperparameter sweeps without refitting.
+
+`contamination` does not change what IsolationForest, CBLOF or the AutoEncoder learn - it only places the cutoff on
+the fitted model's scores (pyod: the (1 - contamination) percentile of the training scores, sklearn: the contamination
+percentile of score_samples). So a sweep only has to fit every *structural* configuration (n_estimators, max_samples,
+n_clusters, ...) once per random seed, in parallel across configurations, keep the raw scores and evaluate every
+contamination level as a threshold over them:
+
+    detectors = param_grid(IsolationForest, n_estimators=[50, 100, 200], max_samples=[128, 256])
+    detectors.update(param_grid(cblof.CBLOF, n_clusters=[6, 8, 10]))
+    table, scores = sweep(detectors, subset_df, contaminations=[0.005, 0.01, 0.02, 0.05], seeds=[0, 1, 2])
+    evaluate_contamination(scores, [0.03])   # more levels later, still without refitting
+
+Stability columns of the table:
+    seed_jaccard       mean pairwise Jaccard overlap of the flagged rows between seeds of the same configuration
+    consensus_jaccard  Jaccard overlap with the rows flagged by a majority of all configurations at that level
+    margin             relative score gap at the cutoff (how far the flagged rows sit above the rest)
+"""
+
+import os
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from ensemble import fit_and_score_all
+
+
+def param_grid(estimator, fixed=None, **grid):
+    """Unfitted `estimator` instances for every combination of `grid`, keyed by a readable name."""
+    from sklearn.model_selection import ParameterGrid
+
+    detectors = {}
+    for params in ParameterGrid(grid):
+        name = '{}({})'.format(estimator.__name__, ', '.join('{}={}'.format(k, v) for k, v in sorted(params.items())))
+        detectors[name] = estimator(**dict(fixed or {}, **params))
+    return detectors
+
+
+def _with_seed(model, seed):
+    params = model.get_params(deep=False)
+    if 'random_state' not in params:
+        return model
+    params['random_state'] = seed
+    return type(model)(**params)
+
+
+def flag_top(scores, contamination):
+    """Rows whose (higher-is-anomalous) score is above the (1 - contamination) percentile, as pyod's threshold_."""
+    return scores > np.percentile(scores, 100 * (1 - contamination))
+
+
+def _jaccard(a, b):
+    union = np.count_nonzero(a | b)
+    return np.count_nonzero(a & b) / union if union else 1.0
+
+
+def _margin(scores, flagged):
+    spread = scores.max() - scores.min()
+    if spread == 0 or flagged.all() or not flagged.any():
+        return 0.0
+    return (scores[flagged].min() - scores[~flagged].max()) / spread
+
+
+def evaluate_contamination(scores, contaminations):
+    """
+    Table of outlier counts and stability metrics from cached scores.
+
+    `scores` maps (configuration, seed) -> raw scores oriented so that higher is more anomalous, as returned by
+    sweep(); one row per (configuration, contamination).
+    """
+    first_seed = {}
+    for key in scores:
+        first_seed.setdefault(key[0], key)
+    configs = list(first_seed)
+    rows = []
+    for contamination in contaminations:
+        flags = {key: flag_top(values, contamination) for key, values in scores.items()}
+        # a row is in the consensus when most configurations flag it with their first seed
+        votes = np.sum([flags[key] for key in first_seed.values()], axis=0)
+        consensus = votes > len(configs) / 2
+        for config in configs:
+            keys = [key for key in scores if key[0] == config]
+            config_flags = [flags[key] for key in keys]
+            margins = [_margin(scores[key], flags[key]) for key in keys]
+            rows.append({
+                'config': config,
+                'contamination': contamination,
+                'outliers': float(np.mean([flag.sum() for flag in config_flags])),
+                'seed_jaccard': (np.mean([_jaccard(a, b) for a, b in combinations(config_flags, 2)])
+                                 if len(config_flags) > 1 else np.nan),
+                'consensus_jaccard': np.mean([_jaccard(flag, consensus) for flag in config_flags]),
+                'margin': float(np.mean(margins)),
+            })
+    return pd.DataFrame(rows)
+
+
+def sweep(detectors, X, contaminations=(0.005, 0.01, 0.02, 0.05), seeds=(0,), max_workers=None,
+          registry_dir=None):
+    """
+    Fit every configuration in `detectors` (name -> unfitted estimator) once per seed, in parallel, and evaluate
+    every contamination level on the cached scores.
+
+    Returns (table, scores): the evaluate_contamination() table and the raw scores keyed by (name, seed), which can
+    be passed to evaluate_contamination() again for other levels. Estimators without a random_state are fitted once.
+    """
+    jobs = {}
+    for name, model in detectors.items():
+        for seed in seeds:
+            seeded = _with_seed(model, seed)
+            jobs[(name, seed)] = seeded
+            if seeded is model:
+                break
+    scores, _ = fit_and_score_all(jobs, X, max_workers or min(len(jobs), os.cpu_count() or 1), registry_dir)
+    return evaluate_contamination(scores, contaminations), scores
@@ -0,0 +1,150 @@
+"""
+Rolling time-window anomaly detection on Order Date.
+
+The "Sales vs. Order Date" and "Profit vs. Order Date" plots only show the series. Here transactions are bucketed
+into daily (or weekly, ...) totals and every bucket is compared with the mean and standard deviation of the buckets
+before it - either over a sliding window or exponentially weighted - so a spike that is normal in December is judged
+against December, not against the whole history. Both statistics are updated in O(1) per bucket, and the detector
+keeps its state so new days of transactions can be fed in without recomputing the history.
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class RollingStats:
+    """Mean / variance over the last `window` values, Welford updates with removal."""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.values.append(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.count > self.window:
+            self._remove(self.values.popleft())
+
+    def _remove(self, value):
+        self.count -= 1
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 -= delta * (value - self.mean)
+
+    @property
+    def std(self):
+        return float(np.sqrt(max(self.m2, 0.0) / (self.count - 1))) if self.count > 1 else float('nan')
+
+
+class EWMStats:
+    """Exponentially weighted mean / variance (West's incremental form)."""
+
+    def __init__(self, alpha=None, halflife=None):
+        if alpha is None:
+            alpha = 1 - np.exp(np.log(0.5) / halflife)
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+
+    def add(self, value):
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+            return
+        delta = value - self.mean
+        increment = self.alpha * delta
+        self.mean += increment
+        self.var = (1 - self.alpha) * (self.var + delta * increment)
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.var)) if self.count > 1 else float('nan')
+
+
+def bucket_series(df, column, date_column='Order Date', freq='D', agg='sum'):
+    """Aggregate transactions into time buckets, dropping buckets without any transaction."""
+    series = df.set_index(date_column)[column].sort_index()
+    buckets = series.resample(freq).agg(agg) if agg != 'sum' else series.resample(freq).sum(min_count=1)
+    return buckets.dropna()
+
+
+class TemporalDetector:
+    """
+    Flags time buckets outside mean -/+ n_sigma * std of the preceding buckets.
+
+    method='rolling' uses the last `window` buckets, method='ewm' an exponentially weighted history with the given
+    `halflife` (in buckets). Buckets without transactions are dropped, so a daily window of 30 spans the last 30 days
+    that had transactions, not 30 calendar days. Each bucket is scored before it is added to the statistics, and buckets are only scored
+    once a later bucket has arrived (the most recent one may still receive transactions); call flush() to score it.
+    """
+
+    def __init__(self, column, date_column='Order Date', freq='D', method='rolling', window=30, halflife=7,
+                 n_sigma=3, min_periods=7):
+        if method not in ('rolling', 'ewm'):
+            raise ValueError("method must be 'rolling' or 'ewm'")
+        self.column = column
+        self.date_column = date_column
+        self.freq = freq
+        self.method = method
+        self.n_sigma = n_sigma
+        self.min_periods = min_periods
+        self.stats = RollingStats(window) if method == 'rolling' else EWMStats(halflife=halflife)
+        self._open_bucket = None
+        self._open_value = 0.0
+        # most recent scored bucket; flush() closes the open bucket, so it cannot be used for the ordering check
+        self._last_closed = None
+
+    def _score(self, bucket, value):
+        mean, std = self.stats.mean, self.stats.std
+        if self.stats.count >= self.min_periods and std == std:
+            lower, upper = mean - self.n_sigma * std, mean + self.n_sigma * std
+            outlier = bool(value > upper or value < lower)
+        else:
+            lower = upper = float('nan')
+            outlier = False
+        self.stats.add(value)
+        self._last_closed = bucket
+        return {'Bucket': bucket, self.column: value, 'Mean': mean, 'Std': std,
+                'Lower': lower, 'Upper': upper, 'Outlier': outlier}
+
+    def update(self, df):
+        """Feed new transactions (in time order relative to earlier updates); return the newly closed buckets."""
+        buckets = bucket_series(df, self.column, self.date_column, self.freq)
+        rows = []
+        for bucket, value in buckets.items():
+            if ((self._open_bucket is not None and bucket < self._open_bucket)
+                    or (self._last_closed is not None and bucket <= self._last_closed)):
+                raise ValueError('Transactions for {} arrived after that bucket was closed'.format(bucket))
+            if bucket == self._open_bucket:
+                self._open_value += value
+                continue
+            if self._open_bucket is not None:
+                rows.append(self._score(self._open_bucket, self._open_value))
+            self._open_bucket, self._open_value = bucket, value
+        return pd.DataFrame(rows, columns=self._columns())
+
+    def flush(self):
+        """Score the most recent (still open) bucket."""
+        if self._open_bucket is None:
+            return pd.DataFrame(columns=self._columns())
+        row = self._score(self._open_bucket, self._open_value)
+        self._open_bucket = None
+        return pd.DataFrame([row], columns=self._columns())
+
+    def _columns(self):
+        return ['Bucket', self.column, 'Mean', 'Std', 'Lower', 'Upper', 'Outlier']
+
+
+def detect_temporal_anomalies(df, column, **kwargs):
+    """One-shot scoring of a whole history."""
+    detector = TemporalDetector(column, **kwargs)
+    return pd.concat([detector.update(df), detector.flush()], ignore_index=True)
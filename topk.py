@@ -0,0 +1,103 @@
+"""
+Top-k / bottom-k retrieval for outlier reports.
+
+The notebook sorted every flagged row, turned the index into a Python list and copied a wide sub-frame only to show
+ten rows. These helpers use np.argpartition to select the k extreme values in linear time, sort just those k, and
+gather only the requested rows and columns. StreamingTopK keeps the same answer for chunked input with a bounded heap.
+"""
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+REPORT_COLUMNS = ['City', 'Category', 'Sub-Category', 'Product Name', 'Sales', 'Quantity', 'Discount', 'Profit']
+
+
+def top_k_positions(values, k, largest=True):
+    """Positions of the k largest (or smallest) values, most extreme first."""
+    values = np.asarray(values)
+    k = min(k, len(values))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    keys = -values if largest else values
+    if k < len(values):
+        candidates = np.argpartition(keys, k - 1)[:k]
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(keys[candidates], kind='stable')]
+
+
+def _top_k_lex_positions(keys, k, largest):
+    # partition on the first key, keep everything tied with the k-th value, then sort that small set on all keys
+    first = keys[0] if largest else -keys[0]
+    k = min(k, len(first))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    kth = np.partition(-first, k - 1)[k - 1]
+    candidates = np.flatnonzero(-first <= kth)
+    order = np.lexsort([(key if largest else -key)[candidates] for key in reversed(keys)])[::-1]
+    return candidates[order[:k]]
+
+
+def top_k(series, k, largest=True):
+    """Equivalent of series.sort_values(ascending=not largest).head(k) without sorting the whole series."""
+    return series.iloc[top_k_positions(series.to_numpy(), k, largest)]
+
+
+def top_k_rows(df, by, k, columns=REPORT_COLUMNS, largest=True, rows=None):
+    """
+    The k rows of `df` with the largest (or smallest) `by`, restricted to `rows` and showing only `columns`.
+
+    `by` is a column name or a list of them (compared lexicographically, like sort_values(by=[...])). `rows` may be
+    a boolean mask or index labels (e.g. the index of an outliers frame). Only the selected rows are gathered.
+    """
+    positions = np.arange(len(df))
+    if rows is not None:
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            positions = np.flatnonzero(rows)
+        else:
+            positions = df.index.get_indexer(rows)
+            # get_indexer marks missing labels with -1, which would otherwise select the last row
+            if (positions < 0).any():
+                raise KeyError('{} not in index'.format(rows[positions < 0].tolist()))
+    if isinstance(by, str):
+        selected = top_k_positions(df[by].to_numpy()[positions], k, largest)
+    else:
+        keys = [df[col].to_numpy()[positions] for col in by]
+        selected = _top_k_lex_positions(keys, k, largest)
+    return df.iloc[positions[selected], df.columns.get_indexer(columns)]
+
+
+class StreamingTopK:
+    """Bounded heap keeping the k items with the largest key seen so far (use -value for the smallest)."""
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+        self._counter = 0
+
+    def push(self, key, item):
+        # the counter breaks ties so that items themselves are never compared
+        entry = (key, self._counter, item)
+        self._counter += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif key > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def push_chunk(self, keys, chunk):
+        """Offer every row of a DataFrame chunk; only the chunk's own top k can enter the heap."""
+        keys = np.asarray(keys)
+        for pos in top_k_positions(keys, self.k):
+            if len(self._heap) == self.k and keys[pos] <= self._heap[0][0]:
+                break
+            self.push(keys[pos], chunk.iloc[pos])
+
+    def items(self):
+        """Items ordered from the largest key down."""
+        return [item for _, _, item in sorted(self._heap, key=lambda entry: (-entry[0], entry[1]))]
+
+    def to_frame(self):
+        return pd.DataFrame(self.items())
@@ -0,0 +1,110 @@
+"""
+Fast Isolation Forest for a single column.
+
+For one feature every isolation tree is just a sorted list of split points with a path length per leaf, and the
+whole forest collapses into one step function over the union of all split points. Scoring a column is then a single
+np.searchsorted() instead of walking 100 trees per row. The estimator follows the sklearn IsolationForest interface
+used in the notebook (fit / score_samples / decision_function / predict with -1 for outliers).
+"""
+
+import numpy as np
+
+from iforest_boundary import average_path_length, step_function
+
+
+def _as_column(X):
+    values = np.asarray(X, dtype=np.float64)
+    if values.ndim == 2:
+        if values.shape[1] != 1:
+            raise ValueError('UnivariateIsolationForest expects a single feature, got {}'.format(values.shape[1]))
+        values = values[:, 0]
+    return values
+
+
+def _build_tree(sample, max_depth, rng):
+    """Return (splits, path_lengths) of one isolation tree grown on a sorted 1-D sample."""
+    splits, path_lengths = [], []
+
+    def grow(lo, hi, depth):
+        # sample[lo:hi] is the node's data; leaves are emitted left to right so splits come out sorted
+        if hi - lo <= 1 or depth >= max_depth or sample[lo] == sample[hi - 1]:
+            path_lengths.append(depth + average_path_length([hi - lo])[0])
+            return
+        split = rng.uniform(sample[lo], sample[hi - 1])
+        middle = lo + np.searchsorted(sample[lo:hi], split, side='right')
+        grow(lo, middle, depth + 1)
+        splits.append(split)
+        grow(middle, hi, depth + 1)
+
+    grow(0, len(sample), 0)
+    return np.asarray(splits), np.asarray(path_lengths)
+
+
+class UnivariateIsolationForest:
+
+    def __init__(self, n_estimators=100, max_samples='auto', contamination='auto', random_state=None):
+        self.n_estimators = n_estimators
+        self.max_samples = max_samples
+        self.contamination = contamination
+        self.random_state = random_state
+
+    def get_params(self, deep=True):
+        return {'n_estimators': self.n_estimators, 'max_samples': self.max_samples,
+                'contamination': self.contamination, 'random_state': self.random_state}
+
+    def fit(self, X, y=None):
+        values = _as_column(X)
+        rng = np.random.default_rng(self.random_state)
+        n_rows = len(values)
+        if self.max_samples == 'auto':
+            self.max_samples_ = min(256, n_rows)
+        elif isinstance(self.max_samples, float):
+            self.max_samples_ = int(self.max_samples * n_rows)
+        else:
+            self.max_samples_ = min(self.max_samples, n_rows)
+        max_depth = int(np.ceil(np.log2(max(self.max_samples_, 2))))
+
+        trees = []
+        for _ in range(self.n_estimators):
+            sample = np.sort(values[rng.choice(n_rows, self.max_samples_, replace=False)])
+            trees.append(_build_tree(sample, max_depth, rng))
+        self._set_forest(trees)
+
+        if self.contamination == 'auto':
+            self.offset_ = -0.5
+        else:
+            self.offset_ = np.percentile(self.score_samples(values), 100.0 * self.contamination)
+        return self
+
+    def _set_forest(self, trees):
+        # merge all trees into one step function: the mean path length on every interval between split points
+        self.trees_ = trees
+        self.breakpoints_ = np.unique(np.concatenate([splits for splits, _ in trees]))
+        total = np.zeros(len(self.breakpoints_) + 1)
+        for splits, path_lengths in trees:
+            total[:-1] += path_lengths[np.searchsorted(splits, self.breakpoints_, side='left')]
+            total[-1] += path_lengths[-1]
+        self.mean_path_length_ = total / len(trees)
+        self.interval_scores_ = -2.0 ** (-self.mean_path_length_ / average_path_length([self.max_samples_])[0])
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Convert a fitted univariate sklearn IsolationForest; scores are identical to the original."""
+        engine = cls(n_estimators=len(model.estimators_), max_samples=model.max_samples,
+                     contamination=model.contamination, random_state=model.random_state)
+        engine.max_samples_ = model.max_samples_
+        engine.offset_ = model.offset_
+        engine.breakpoints_, decision_values = step_function(model)
+        engine.interval_scores_ = decision_values + model.offset_
+        engine.mean_path_length_ = -np.log2(-engine.interval_scores_) * average_path_length([model.max_samples_])[0]
+        engine.trees_ = None
+        return engine
+
+    def score_samples(self, X):
+        return self.interval_scores_[np.searchsorted(self.breakpoints_, _as_column(X), side='left')]
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)